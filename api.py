@@ -0,0 +1,83 @@
+from flask import g, session, request, flash
+from flask_restful import Api, Resource
+from functools import wraps
+from models import db, Quiz, Question
+from grading import grade, record_score, answer_key
+from cache import cached
+from user_cache import get_user_info
+
+api = Api(prefix='/api')
+
+# session based auth like the html routes, but answers with json instead of a redirect
+def api_auth_required(func):
+    @wraps(func)
+    def inner(*args, **kwargs):
+        if 'user_id' not in session:
+            return {'message': 'Please, login to continue!'}, 401
+        user = get_user_info(session['user_id'])
+        if user is None:  # deleted since it logged in
+            return {'message': 'Please, login to continue!'}, 401
+        g.user_info = user
+        return func(*args, **kwargs)
+    return inner
+
+
+# Whole quiz in one response, without the correct options
+class QuizResource(Resource):
+    method_decorators = [api_auth_required]
+
+    def get(self, id):
+        quiz = Quiz.query.get(id)
+        if not quiz:
+            return {'message': 'Quiz does not exist!'}, 404
+        return cached(('api_quiz', quiz.id, quiz.version), lambda: self.payload(quiz))
+
+    def payload(self, quiz):
+        questions = (
+            db.session.query(Question.id, Question.question_title, Question.question_statement,
+                             Question.option1, Question.option2, Question.option3, Question.option4)
+            .filter(Question.quiz_id == quiz.id)
+            .order_by(Question.id)
+            .all()
+        )
+        return {
+            'id': quiz.id,
+            'chapter': quiz.chapter.name,
+            'subject': quiz.chapter.subject.name,
+            'date_of_quiz': quiz.date_of_quiz.isoformat(),
+            'time_duration': int(quiz.time_duration.total_seconds()),
+            'questions': [{
+                'id': question.id,
+                'title': question.question_title,
+                'statement': question.question_statement,
+                'options': [question.option1, question.option2, question.option3, question.option4],
+            } for question in questions],
+        }
+
+
+# All answers of an attempt graded and saved in a single request/transaction
+class QuizSubmitResource(Resource):
+    method_decorators = [api_auth_required]
+
+    def post(self, id):
+        quiz = Quiz.query.get(id)
+        if not quiz:
+            return {'message': 'Quiz does not exist!'}, 404
+        data = request.get_json(silent=True) or {}
+        answers = data.get('answers')
+        if not isinstance(answers, dict):
+            return {'message': 'answers must be an object of question id to selected option'}, 400
+        answers = {str(question_id): answer for question_id, answer in answers.items()}
+
+        key = answer_key(quiz)
+        score = grade(key, answers)
+        score_record = record_score(session['user_id'], quiz.id, score)
+
+        flash(f'Quiz submitted successfully! Your score: {score}/{len(key.question_ids)}')
+        # score_id is None when the score was queued for the write-behind writer
+        score_id = score_record.id if score_record else None
+        return {'score_id': score_id, 'score': score, 'total': len(key.question_ids)}, 201
+
+
+api.add_resource(QuizResource, '/quiz/<int:id>', endpoint='api_quiz')
+api.add_resource(QuizSubmitResource, '/quiz/<int:id>/submit', endpoint='api_quiz_submit')
@@ -1,15 +1,47 @@
-from flask import Flask, render_template
+from flask import Flask
+from config import Config
 
-app = Flask(__name__)
 
-import config
+# Creating the app only reads the config and registers routes/commands.
+# The schema and the admin user are set up by "flask init-db" / "flask seed-admin".
+def create_app(config=Config):
+    app = Flask(__name__)
+    app.config.from_object(config)
 
-import models
+    from engine import engine_options, apply_sqlite_pragmas
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config))
 
-#import api
+    from models import db
+    db.init_app(app)
+    with app.app_context():
+        apply_sqlite_pragmas(db.engine, app.config)
 
-import routes
+    import routes
+    app.register_blueprint(routes.bp)
+
+    import api
+    api.api.init_app(app)
+
+    import commands
+    app.register_blueprint(commands.bp)
+
+    from assets import init_assets
+    init_assets(app)
+
+    from rendering import init_rendering
+    init_rendering(app)
+
+    if app.config.get('METRICS'):
+        from metrics import init_metrics
+        init_metrics(app)
+
+    if app.config.get('INDEX_AUDIT'):
+        from index_audit import audit_indexes
+        with app.app_context():
+            audit_indexes()
+
+    return app
 
 
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    create_app().run(debug=True)
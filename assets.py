@@ -0,0 +1,132 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+from flask import current_app, request, send_from_directory
+
+# Static files served by the app itself (Bootstrap, Font Awesome and Chart.js are vendored in
+# static/vendor, so pages load without a CDN).
+#
+# "flask build-assets" copies every file of static/ to static/dist/ under a name with
+# its content hash (bootstrap.min.css -> bootstrap.min.3f2a9c1d8e7b.css), writes
+# .gz (and, with the brotli package installed, .br) variants next to the text files,
+# and lists the names in static/dist/manifest.json. Once built, url_for('static',
+# filename=...) gives the hashed URL, and those are sent with the precompressed
+# variant the browser accepts and cached for a year: a changed file gets a new name.
+# Without a build the plain files are served as usual.
+
+DIST = 'dist'
+MANIFEST = 'manifest.json'
+COMPRESSIBLE = ('.css', '.js', '.svg', '.ttf', '.json', '.map', '.txt')
+CSS_URL = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def file_hash(data):
+    return hashlib.sha256(data).hexdigest()[:12]
+
+def hashed_name(filename, digest):
+    base, ext = posixpath.splitext(filename)
+    return f'{base}.{digest}{ext}'
+
+# relative url()s of a stylesheet (e.g. Font Awesome's ../webfonts/) point at the hashed files
+def rewrite_css_urls(css, filename, manifest):
+    folder = posixpath.dirname(filename)
+
+    def replace(match):
+        quote, url = match.groups()
+        if url.startswith(('data:', '/', 'http:', 'https:', '#')):
+            return match.group(0)
+        path, suffix = re.match(r'([^?#]*)(.*)', url).groups()
+        target = manifest.get(posixpath.normpath(posixpath.join(folder, path)))
+        if target is None:
+            return match.group(0)
+        return f'url({quote}{posixpath.relpath(target, folder)}{suffix}{quote})'
+
+    return CSS_URL.sub(replace, css)
+
+def write_file(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as file:
+        file.write(data)
+
+# Returns the manifest ({name: hashed name}). Old hashed files are kept, so pages
+# rendered before a deploy can still load theirs.
+def build_assets(static_folder):
+    dist = os.path.join(static_folder, DIST)
+    sources = []
+    for root, dirs, files in os.walk(static_folder):
+        if os.path.abspath(root) == os.path.abspath(static_folder) and DIST in dirs:
+            dirs.remove(DIST)
+        for name in files:
+            sources.append(os.path.relpath(os.path.join(root, name), static_folder).replace(os.sep, '/'))
+    manifest = {}
+    # stylesheets last, they refer to the other files by their hashed names
+    for filename in sorted(sources, key=lambda name: (name.endswith('.css'), name)):
+        with open(os.path.join(static_folder, filename), 'rb') as file:
+            data = file.read()
+        if filename.endswith('.css'):
+            data = rewrite_css_urls(data.decode('utf-8'), filename, manifest).encode('utf-8')
+        target = hashed_name(filename, file_hash(data))
+        manifest[filename] = target
+        path = os.path.join(dist, target)
+        write_file(path, data)
+        if filename.endswith(COMPRESSIBLE):
+            write_file(path + '.gz', gzip.compress(data, compresslevel=9, mtime=0))
+            if brotli is not None:
+                write_file(path + '.br', brotli.compress(data, quality=11))
+    with open(os.path.join(dist, MANIFEST), 'w') as file:
+        json.dump(manifest, file, indent=1, sort_keys=True)
+    return manifest
+
+def load_manifest(app):
+    manifest = app.extensions.get('assets_manifest')
+    if manifest is None:
+        try:
+            with open(os.path.join(app.static_folder, DIST, MANIFEST)) as file:
+                names = json.load(file)
+        except FileNotFoundError:
+            names = {}
+        manifest = app.extensions['assets_manifest'] = {
+            'names': names,
+            'hashed': {f'{DIST}/{target}' for target in names.values()},
+        }
+    return manifest
+
+
+# url_for('static', filename='vendor/...') -> the hashed file, when there is one
+def hashed_static_url(endpoint, values):
+    if endpoint == 'static' and 'filename' in values:
+        target = load_manifest(current_app)['names'].get(values['filename'])
+        if target is not None:
+            values['filename'] = f'{DIST}/{target}'
+
+def send_static(filename):
+    if filename not in load_manifest(current_app)['hashed']:
+        return current_app.send_static_file(filename)
+    folder = current_app.static_folder
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    encoding = None
+    for name, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if request.accept_encodings[name] and os.path.isfile(os.path.join(folder, filename + suffix)):
+            encoding = name
+            filename += suffix
+            break
+    response = send_from_directory(folder, filename, mimetype=mimetype, max_age=current_app.config['ASSETS_MAX_AGE'])
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+def init_assets(app):
+    app.url_defaults(hashed_static_url)
+    app.view_functions['static'] = send_static
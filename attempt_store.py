@@ -0,0 +1,107 @@
+from collections import OrderedDict
+from threading import Lock
+from uuid import uuid4
+from flask import current_app
+from models import db, Attempt, AttemptAnswer
+
+# Quiz attempt state (answers + remaining time) is kept server side,
+# the session cookie only carries the attempt id.
+# An attempt is returned as a dict: id, user_id, quiz_id, remaining_time
+
+class DatabaseAttemptStore:
+    """Default backend, answers are rows of the AttemptAnswer table."""
+
+    def start(self, user_id, quiz_id, remaining_time):
+        # drop any attempt of this quiz the user left half way
+        Attempt.query.filter_by(user_id=user_id, quiz_id=quiz_id).delete()
+        attempt = Attempt(user_id=user_id, quiz_id=quiz_id, remaining_time=remaining_time)
+        db.session.add(attempt)
+        db.session.commit()
+        return attempt.id
+
+    def get(self, attempt_id):
+        attempt = db.session.get(Attempt, attempt_id) if attempt_id else None
+        if not attempt:
+            return None
+        return {'id': attempt.id, 'user_id': attempt.user_id,
+                'quiz_id': attempt.quiz_id, 'remaining_time': attempt.remaining_time}
+
+    def save_answer(self, attempt_id, question_id, selected_answer, remaining_time):
+        updated = AttemptAnswer.query.filter_by(attempt_id=attempt_id, question_id=question_id).update(
+            {'selected_answer': selected_answer})
+        if not updated:
+            db.session.add(AttemptAnswer(attempt_id=attempt_id, question_id=question_id,
+                                         selected_answer=selected_answer))
+        Attempt.query.filter_by(id=attempt_id).update({'remaining_time': remaining_time})
+        db.session.commit()
+
+    def answers(self, attempt_id):
+        rows = db.session.query(AttemptAnswer.question_id, AttemptAnswer.selected_answer).filter_by(
+            attempt_id=attempt_id)
+        return {str(question_id): selected_answer for question_id, selected_answer in rows}
+
+    def finish(self, attempt_id):
+        AttemptAnswer.query.filter_by(attempt_id=attempt_id).delete()
+        Attempt.query.filter_by(id=attempt_id).delete()
+        db.session.commit()
+
+
+class MemoryAttemptStore:
+    """Process local LRU backend, only for a single worker process."""
+
+    def __init__(self, max_size=1000):
+        self.max_size = max_size
+        self.attempts = OrderedDict()
+        self.lock = Lock()
+
+    def start(self, user_id, quiz_id, remaining_time):
+        attempt_id = uuid4().hex
+        with self.lock:
+            # drop any attempt of this quiz the user left half way
+            for key in [key for key, attempt in self.attempts.items()
+                        if attempt['user_id'] == user_id and attempt['quiz_id'] == quiz_id]:
+                del self.attempts[key]
+            self.attempts[attempt_id] = {'id': attempt_id, 'user_id': user_id, 'quiz_id': quiz_id,
+                                         'remaining_time': remaining_time, 'answers': {}}
+            while len(self.attempts) > self.max_size:
+                self.attempts.popitem(last=False)
+        return attempt_id
+
+    def get(self, attempt_id):
+        with self.lock:
+            attempt = self.attempts.get(attempt_id)
+            if not attempt:
+                return None
+            self.attempts.move_to_end(attempt_id)
+            return {key: value for key, value in attempt.items() if key != 'answers'}
+
+    def save_answer(self, attempt_id, question_id, selected_answer, remaining_time):
+        with self.lock:
+            attempt = self.attempts.get(attempt_id)
+            if attempt:
+                attempt['answers'][str(question_id)] = selected_answer
+                attempt['remaining_time'] = remaining_time
+                self.attempts.move_to_end(attempt_id)
+
+    def answers(self, attempt_id):
+        with self.lock:
+            attempt = self.attempts.get(attempt_id)
+            return dict(attempt['answers']) if attempt else {}
+
+    def finish(self, attempt_id):
+        with self.lock:
+            self.attempts.pop(attempt_id, None)
+
+
+def get_attempt_store():
+    store = current_app.extensions.get('attempt_store')
+    if store is None:
+        backend = current_app.config.get('ATTEMPT_STORE', 'database')
+        if backend == 'memory':
+            store = MemoryAttemptStore(current_app.config.get('ATTEMPT_STORE_SIZE', 1000))
+        elif backend == 'database':
+            store = DatabaseAttemptStore()
+        else:
+            raise ValueError(f'Unknown ATTEMPT_STORE backend: {backend}')
+        current_app.extensions['attempt_store'] = store
+    return store
@@ -0,0 +1,53 @@
+"""Cold start benchmark: time from a fresh interpreter importing the app to its first response.
+
+Each run is a new process, so nothing is warm. Run from the project folder:
+
+    python benchmarks/cold_start.py --runs 10
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# runs inside the child process, prints the timings as json
+CHILD = '''
+import json, sys, time
+start = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+app = create_app()
+created = time.perf_counter()
+response = app.test_client().get('/login')
+assert response.status_code == 200, response.status_code
+done = time.perf_counter()
+print(json.dumps({'import': imported - start, 'create_app': created - imported,
+                  'first_response': done - created, 'total': done - start}))
+'''
+
+def run_once(env):
+    output = subprocess.run([sys.executable, '-c', CHILD], cwd=ROOT, env=env,
+                            check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, SQLALCHEMY_DATABASE_URI=f'sqlite:///{tmp}/bench.sqlite')
+        results = [run_once(env) for _ in range(args.runs)]
+
+    print(f'{args.runs} cold starts (ms):')
+    for key in ('import', 'create_app', 'first_response', 'total'):
+        values = [result[key] * 1000 for result in results]
+        print(f'  {key:<15} median {statistics.median(values):8.1f}   min {min(values):8.1f}   max {max(values):8.1f}')
+
+
+if __name__ == '__main__':
+    main()
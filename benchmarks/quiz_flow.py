@@ -0,0 +1,394 @@
+"""Quiz flow benchmark: seed a synthetic dataset, then drive the real routes and report latency.
+
+Each virtual user logs in, opens the dashboard, answers every question of an upcoming
+quiz (start_quiz once per question), submits it and opens the score page. Admin sessions
+open the summary and run searches. Requests go through the Flask test client, or through
+a local WSGI server with --server. Queries per request come from the app's own metrics
+(metrics.py). Run from the project folder:
+
+    python benchmarks/quiz_flow.py --scale small --users 50 --save benchmarks/results/base.json
+    python benchmarks/quiz_flow.py --scale small --users 50 --compare benchmarks/results/base.json
+
+--serve dev|gunicorn starts the app in a separate process, under the Flask development
+server ("flask run" with .env's debug mode) or under gunicorn with gunicorn.conf.py, and
+goes through it over HTTP, so the two can be compared on the same dataset and load:
+
+    python benchmarks/quiz_flow.py --scale small --concurrency 16 --serve dev --save benchmarks/results/dev.json
+    python benchmarks/quiz_flow.py --scale small --concurrency 16 --serve gunicorn --compare benchmarks/results/dev.json
+
+Queries per request are not known then (the metrics are in the server process).
+
+The app config is read from the environment as usual (e.g. SCORE_WRITE_BEHIND=true),
+so configurations can be compared on the same dataset. --database must be empty, it is
+seeded from scratch (default: a temporary SQLite file).
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+from urllib.parse import urlencode
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# subjects, chapters per subject, quizzes per chapter, questions per quiz, users, scores per user
+SCALES = {
+    'tiny': (2, 2, 2, 5, 20, 5),
+    'small': (5, 4, 5, 10, 200, 10),
+    'medium': (20, 10, 10, 20, 5000, 20),
+    'large': (50, 20, 10, 25, 50000, 40),
+}
+WORDS = ['algebra', 'vector', 'matrix', 'energy', 'photon', 'enzyme', 'genome', 'market', 'empire', 'sonnet',
+         'integral', 'entropy', 'protein', 'treaty', 'syntax', 'circuit', 'orbit', 'theorem', 'climate', 'atom']
+OPTIONS = ['A', 'B', 'C', 'D']
+PASSWORD = 'password'
+CHUNK = 5000
+
+
+# ---- dataset ----
+
+def insert_chunks(model, rows):
+    from sqlalchemy import insert
+    from models import db
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= CHUNK:
+            db.session.execute(insert(model.__table__), chunk)
+            chunk = []
+    if chunk:
+        db.session.execute(insert(model.__table__), chunk)
+    db.session.commit()
+
+def cli(app, *args):
+    result = app.test_cli_runner().invoke(args=list(args))
+    if result.exit_code != 0:
+        raise SystemExit(f'flask {" ".join(args)} failed:\n{result.output}')
+
+def seed(app, scale, rng):
+    from werkzeug.security import generate_password_hash
+    from models import Subject, Chapter, Quiz, Question, User, Score
+    subjects, chapters_per_subject, quizzes_per_chapter, questions_per_quiz, users, scores_per_user = scale
+    chapters = subjects * chapters_per_subject
+    quizzes = chapters * quizzes_per_chapter
+    today = date.today()
+
+    cli(app, 'init-db')
+    cli(app, 'seed-admin')
+    with app.app_context():
+        insert_chunks(Subject, ({'id': s, 'name': f'Subject {s}', 'description': f'{rng.choice(WORDS)} studies'}
+                                for s in range(1, subjects + 1)))
+        insert_chunks(Chapter, ({'id': c, 'name': f'Chapter {c} {rng.choice(WORDS)}', 'description': '',
+                                 'subject_id': (c - 1) // chapters_per_subject + 1}
+                                for c in range(1, chapters + 1)))
+        # two thirds of the quizzes are still open
+        insert_chunks(Quiz, ({'id': q, 'chapter_id': (q - 1) // quizzes_per_chapter + 1,
+                              'date_of_quiz': today + timedelta(days=rng.randint(-30, 60)),
+                              'time_duration': timedelta(minutes=30), 'remarks': ''}
+                             for q in range(1, quizzes + 1)))
+        insert_chunks(Question, ({'quiz_id': q, 'question_title': f'Q{n}',
+                                  'question_statement': f'{rng.choice(WORDS)} {rng.choice(WORDS)} question {n} of quiz {q}',
+                                  'option1': 'A', 'option2': 'B', 'option3': 'C', 'option4': 'D',
+                                  'correct_option': rng.choice(OPTIONS)}
+                                 for q in range(1, quizzes + 1) for n in range(1, questions_per_quiz + 1)))
+        passhash = generate_password_hash(PASSWORD)  # hashing is slow, every user shares it
+        insert_chunks(User, ({'username': f'user{u}', 'passhash': passhash, 'name': f'User {u}', 'is_admin': False}
+                             for u in range(1, users + 1)))
+        user_ids = [user_id for user_id, in User.query.with_entities(User.id).filter(User.is_admin == False)]
+        insert_chunks(Score, ({'user_id': user_id, 'quiz_id': rng.randint(1, quizzes),
+                               'score': rng.randint(0, questions_per_quiz),
+                               'date_attempted': today - timedelta(days=rng.randint(0, 365))}
+                              for user_id in user_ids for _ in range(scores_per_user)))
+        open_quizzes = [quiz_id for quiz_id, in Quiz.query.with_entities(Quiz.id).filter(Quiz.date_of_quiz >= today)]
+    cli(app, 'backfill-counters')
+    cli(app, 'rebuild-summaries')
+    cli(app, 'rebuild-search-index')
+    return open_quizzes
+
+
+# ---- drivers, one per virtual user (each has its own session cookie) ----
+
+class TestClientDriver:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    # the body is read and the response closed as a server would: streamed pages
+    # (rendering.stream_page) render while they are read, and record their metrics on close
+    def request(self, method, path, data=None):
+        response = self.client.open(path, method=method, data=data)
+        response.get_data()
+        response.close()
+        return response.status_code
+
+class HttpDriver:
+    def __init__(self, host, port):
+        self.connection = http.client.HTTPConnection(host, port)
+        self.cookie = None
+
+    def request(self, method, path, data=None):
+        headers = {'Content-Type': 'application/x-www-form-urlencoded'} if data else {}
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+        self.connection.request(method, path, urlencode(data) if data else None, headers)
+        response = self.connection.getresponse()
+        response.read()
+        cookie = response.getheader('Set-Cookie')
+        if cookie:
+            self.cookie = cookie.split(';', 1)[0]
+        return response.status
+
+def start_server(app):
+    from werkzeug.serving import make_server
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def free_port():
+    import socket
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+# the app in its own process, on the seeded database
+def start_process(kind, port, env):
+    if kind == 'dev':
+        command = [sys.executable, '-m', 'flask', '--app', 'app', 'run', '--no-reload', '--port', str(port)]
+    else:
+        command = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--bind', f'127.0.0.1:{port}', 'wsgi:app']
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f'{kind} server exited with {process.returncode}')
+        try:
+            HttpDriver('127.0.0.1', port).request('GET', '/login')
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise SystemExit(f'{kind} server did not start')
+
+
+# ---- flows ----
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}  # step -> [seconds]
+        self.errors = {}
+        self.lock = threading.Lock()
+
+    def call(self, driver, step, method, path, data=None, expect=(200, 302)):
+        start = time.perf_counter()
+        status = driver.request(method, path, data)
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            self.samples.setdefault(step, []).append(elapsed)
+            if status not in expect:
+                self.errors[step] = self.errors.get(step, 0) + 1
+
+def user_flow(driver, recorder, rng, users, open_quizzes, questions_per_quiz):
+    call = recorder.call
+    call(driver, 'main.login_post', 'POST', '/login', {'username': f'user{rng.randint(1, users)}', 'password': PASSWORD})
+    call(driver, 'main.index', 'GET', '/')
+    quiz_id = rng.choice(open_quizzes)
+    for n in range(questions_per_quiz):
+        call(driver, 'main.start_quiz GET', 'GET', f'/start_quiz/{quiz_id}?current_question={n}')
+        if n < questions_per_quiz - 1:
+            call(driver, 'main.start_quiz POST', 'POST', f'/start_quiz/{quiz_id}?current_question={n}',
+                 {'ans': rng.choice(OPTIONS), 'remaining_time': 1000 - n})
+    call(driver, 'main.submit_quiz', 'POST', f'/submit_quiz/{quiz_id}', {'ans': rng.choice(OPTIONS)})
+    call(driver, 'main.score', 'GET', '/score')
+    call(driver, 'main.logout', 'GET', '/logout')
+
+def admin_flow(driver, recorder, rng):
+    call = recorder.call
+    call(driver, 'main.login_post', 'POST', '/login', {'username': 'admin', 'password': 'admin'})
+    call(driver, 'main.admin_summary', 'GET', '/admin/summary')
+    for parameter in ('question', 'sname', 'user'):
+        query = rng.choice(WORDS) if parameter == 'question' else ('Sub' if parameter == 'sname' else 'user1')
+        call(driver, 'main.admin_search', 'GET', f'/admin/search?{urlencode({"parameter": parameter, "query": query})}')
+    call(driver, 'main.logout', 'GET', '/logout')
+
+
+# ---- report ----
+
+def percentile(values, q):
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method='inclusive')[q - 1]
+
+# pages sent with rendering.stream_page that the flows visit
+STREAMED_STEPS = ('main.score', 'main.admin_search')
+
+def summarize(recorder, metrics, seconds):
+    query_counts = {endpoint: stats.queries / stats.count for endpoint, stats in metrics.snapshot()[0]} if metrics else {}
+    steps = {}
+    for step, values in sorted(recorder.samples.items()):
+        steps[step] = {
+            'count': len(values),
+            'mean_ms': statistics.fmean(values) * 1000,
+            'p50_ms': percentile(values, 50) * 1000,
+            'p95_ms': percentile(values, 95) * 1000,
+            'p99_ms': percentile(values, 99) * 1000,
+            'queries': query_counts.get(step.split(' ')[0]),
+            'errors': recorder.errors.get(step, 0),
+        }
+    requests = sum(step['count'] for step in steps.values())
+    return {'requests': requests, 'seconds': seconds, 'throughput_rps': requests / seconds, 'steps': steps}
+
+def print_report(result, baseline=None):
+    print(f"{result['requests']} requests in {result['seconds']:.1f}s, {result['throughput_rps']:.1f} req/s"
+          + (f" (baseline {baseline['throughput_rps']:.1f})" if baseline else ''))
+    print(f"{'step':<22}{'count':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}{'errors':>8}"
+          + ('   p95 vs baseline' if baseline else ''))
+    for step, stats in result['steps'].items():
+        queries = '-' if stats['queries'] is None else f"{stats['queries']:.1f}"
+        line = (f"{step:<22}{stats['count']:>7}{stats['p50_ms']:>9.1f}{stats['p95_ms']:>9.1f}"
+                f"{stats['p99_ms']:>9.1f}{queries:>9}{stats['errors']:>8}")
+        base = baseline['steps'].get(step) if baseline else None
+        if base:
+            line += f"   {(stats['p95_ms'] / base['p95_ms'] - 1) * 100:+6.1f}%"
+            if base['queries'] is not None and stats['queries'] is not None and stats['queries'] != base['queries']:
+                line += f"  queries {base['queries']:.1f} -> {stats['queries']:.1f}"
+        print(line)
+
+# steps whose p95 got slower than tolerance allows, or that run more queries
+def regressions(result, baseline, tolerance):
+    found = []
+    for step, stats in result['steps'].items():
+        base = baseline['steps'].get(step)
+        if not base:
+            continue
+        if stats['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+            found.append(f"{step}: p95 {base['p95_ms']:.1f} -> {stats['p95_ms']:.1f} ms")
+        if base['queries'] is not None and stats['queries'] is not None and stats['queries'] > base['queries'] + 0.01:
+            found.append(f"{step}: queries {base['queries']:.1f} -> {stats['queries']:.1f}")
+    return found
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, check=True,
+                              capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', choices=SCALES, default='small')
+    parser.add_argument('--users', type=int, default=50, help='virtual users, each takes one quiz')
+    parser.add_argument('--admins', type=int, default=10, help='admin sessions')
+    parser.add_argument('--concurrency', type=int, default=1, help='threads running the sessions')
+    parser.add_argument('--server', action='store_true', help='go through a local WSGI server instead of the test client')
+    parser.add_argument('--serve', choices=['dev', 'gunicorn'], help='start that server in a separate process and go through it')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--database', help='SQLAlchemy URL of an empty database (default: temporary SQLite file)')
+    parser.add_argument('--save', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='JSON file of an earlier run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed p95 slowdown when comparing (0.2 = 20%%)')
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    os.environ['SQLALCHEMY_DATABASE_URI'] = args.database or f'sqlite:///{tmp.name}/bench.sqlite'
+    os.environ['METRICS'] = 'true'
+    os.environ['METRICS_QUERY_THRESHOLD'] = str(10 ** 6)
+    os.environ.setdefault('SCORE_SPOOL_DIR', os.path.join(tmp.name, 'score_spool'))
+    from app import create_app
+    app = create_app()
+
+    rng = random.Random(args.seed)
+    scale = SCALES[args.scale]
+    start = time.perf_counter()
+    open_quizzes = seed(app, scale, rng)
+    seed_seconds = time.perf_counter() - start
+    print(f'Seeded scale {args.scale} {scale} in {seed_seconds:.1f}s')
+
+    process = None
+    if args.serve:
+        port = free_port()
+        process = start_process(args.serve, port, dict(os.environ))
+        new_driver = lambda: HttpDriver('127.0.0.1', port)
+    elif args.server:
+        server = start_server(app)
+        new_driver = lambda: HttpDriver('127.0.0.1', server.server_port)
+    else:
+        new_driver = lambda: TestClientDriver(app)
+
+    # the same sessions in the same order for a given --seed
+    sessions = ['user'] * args.users + ['admin'] * args.admins
+    rng.shuffle(sessions)
+    work = [(kind, random.Random(rng.random())) for kind in sessions]
+    recorder = Recorder()
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                if not work:
+                    return
+                kind, session_rng = work.pop(0)
+            if kind == 'user':
+                user_flow(new_driver(), recorder, session_rng, scale[4], open_quizzes, scale[3])
+            else:
+                admin_flow(new_driver(), recorder, session_rng)
+
+    # reset the metrics collected while seeding
+    app.extensions['metrics'].endpoints.clear()
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - start
+    if process:
+        process.terminate()
+        process.wait()
+    result = summarize(recorder, None if process else app.extensions['metrics'], seconds)
+    if not process:
+        # a streamed page is only counted once its body was sent, a gap here means it never was
+        unmeasured = [step for step in STREAMED_STEPS if step in result['steps'] and result['steps'][step]['queries'] is None]
+        if unmeasured:
+            raise SystemExit(f"No query counts recorded for the streamed pages {', '.join(unmeasured)}")
+    result['meta'] = {
+        'commit': git_commit(), 'date': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(), 'scale': args.scale, 'dataset': scale,
+        'users': args.users, 'admins': args.admins, 'concurrency': args.concurrency,
+        'driver': args.serve or ('server' if args.server else 'test_client'), 'seed': args.seed, 'seed_seconds': seed_seconds,
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        print(f"Compared with {args.compare} (commit {baseline['meta'].get('commit')})")
+        for key in ('scale', 'users', 'admins', 'concurrency', 'driver', 'seed'):
+            if baseline['meta'].get(key) != result['meta'][key]:
+                print(f"WARNING: {key} differs from the baseline ({baseline['meta'].get(key)} vs {result['meta'][key]})")
+    print_report(result, baseline)
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, 'w') as file:
+            json.dump(result, file, indent=2)
+        print(f'Saved {args.save}')
+
+    if baseline:
+        found = regressions(result, baseline, args.tolerance)
+        for line in found:
+            print(f'REGRESSION {line}')
+        if found:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
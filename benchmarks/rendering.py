@@ -0,0 +1,137 @@
+"""Rendering benchmark: time to first byte and bytes on the wire of the long listing pages.
+
+The same seeded dataset is served twice by a local WSGI server: once as before
+rendering.py (pages rendered whole, sent uncompressed) and once with streaming and
+compression on. Every page is fetched --repeat times with a browser's Accept-Encoding.
+Then a fresh process compiles all templates, without and with the on-disk bytecode
+cache, which is what a new worker pays before its first page. Run from the project folder:
+
+    python benchmarks/rendering.py --scale small --per-page 500
+"""
+import argparse
+import http.client
+import json
+import logging
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import urlencode
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from quiz_flow import SCALES, PASSWORD, WORDS, seed, start_server
+
+ACCEPT_ENCODING = 'gzip, deflate, br'
+
+# runs inside the child process, prints the timings as json
+CHILD = '''
+import json, time
+from app import create_app
+from rendering import warm_templates
+app = create_app()
+start = time.perf_counter()
+warm_templates(app)
+print(json.dumps({'seconds': time.perf_counter() - start}))
+'''
+
+
+class Client:
+    def __init__(self, port):
+        self.connection = http.client.HTTPConnection('127.0.0.1', port)
+        self.cookie = None
+
+    def login(self, username, password):
+        self.connection.request('POST', '/login', urlencode({'username': username, 'password': password}),
+                                {'Content-Type': 'application/x-www-form-urlencoded'})
+        response = self.connection.getresponse()
+        response.read()
+        self.cookie = response.getheader('Set-Cookie').split(';', 1)[0]
+
+    # (seconds to the first byte of the body, seconds to the last, body bytes as sent)
+    def fetch(self, path):
+        start = time.perf_counter()
+        self.connection.request('GET', path, headers={'Cookie': self.cookie, 'Accept-Encoding': ACCEPT_ENCODING})
+        response = self.connection.getresponse()
+        first = response.read(1)
+        first_byte = time.perf_counter() - start
+        body = first + response.read()
+        assert response.status == 200, (path, response.status)
+        return first_byte, time.perf_counter() - start, len(body), response.getheader('Content-Encoding')
+
+def measure(app, pages, repeat):
+    server = start_server(app)
+    admin, user = Client(server.server_port), Client(server.server_port)
+    admin.login('admin', 'admin')
+    user.login('user1', PASSWORD)
+    results = {}
+    for name, (who, path) in pages.items():
+        client = admin if who == 'admin' else user
+        client.fetch(path)  # warm up
+        samples = [client.fetch(path) for _ in range(repeat)]
+        results[name] = {
+            'ttfb_ms': statistics.median(sample[0] for sample in samples) * 1000,
+            'total_ms': statistics.median(sample[1] for sample in samples) * 1000,
+            'bytes': samples[-1][2],
+            'encoding': samples[-1][3] or 'identity',
+        }
+    server.shutdown()
+    return results
+
+def compile_seconds(env):
+    output = subprocess.run([sys.executable, '-c', CHILD], cwd=ROOT, env=env,
+                            check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])['seconds']
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', choices=SCALES, default='small')
+    parser.add_argument('--per-page', type=int, default=200, help='rows per page of the listings')
+    parser.add_argument('--repeat', type=int, default=20, help='fetches of each page')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)  # no line per request
+    tmp = tempfile.TemporaryDirectory()
+    os.environ['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{tmp.name}/bench.sqlite'
+    for name in ('ADMIN_PER_PAGE', 'SCORES_PER_PAGE', 'SEARCH_PER_PAGE'):
+        os.environ[name] = str(args.per_page)
+    os.environ['JINJA_CACHE_DIR'] = os.path.join(tmp.name, 'jinja_cache')
+    from app import create_app
+    from config import Config
+
+    rng = random.Random(args.seed)
+    before = create_app(type('Before', (Config,), {'STREAM_TEMPLATES': False, 'COMPRESS': False,
+                                                   'JINJA_BYTECODE_CACHE': False}))
+    seed(before, SCALES[args.scale], rng)
+    after = create_app()
+
+    pages = {
+        'admin/users': ('admin', '/admin/users'),
+        'quiz': ('admin', '/quiz'),
+        'admin/search': ('admin', '/admin/search?' + urlencode({'parameter': 'question', 'query': WORDS[0]})),
+        'user/score': ('user', '/score'),
+    }
+    results = {'before': measure(before, pages, args.repeat), 'after': measure(after, pages, args.repeat)}
+
+    print(f'Scale {args.scale}, {args.per_page} rows per page, median of {args.repeat} fetches')
+    print(f"{'page':<16}{'TTFB ms':>18}{'total ms':>18}{'bytes':>24}")
+    for name in pages:
+        b, a = results['before'][name], results['after'][name]
+        print(f"{name:<16}{b['ttfb_ms']:>8.1f} -> {a['ttfb_ms']:>6.1f}{b['total_ms']:>8.1f} -> {a['total_ms']:>6.1f}"
+              f"{b['bytes']:>10} -> {a['bytes']:>8} {a['encoding']}")
+
+    env = dict(os.environ, JINJA_CACHE_DIR=os.path.join(tmp.name, 'jinja_cache_cold'))
+    no_cache = compile_seconds(dict(env, JINJA_BYTECODE_CACHE='false'))
+    compile_seconds(env)  # fills the cache
+    cached = compile_seconds(env)
+    print(f'Loading all templates in a new process: {no_cache * 1000:.1f} ms compiled, '
+          f'{cached * 1000:.1f} ms from the bytecode cache')
+
+
+if __name__ == '__main__':
+    main()
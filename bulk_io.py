@@ -0,0 +1,256 @@
+import csv
+import io
+import json
+from collections import Counter
+from datetime import date, datetime, timedelta
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+from models import db, Subject, Chapter, Quiz, Question, bump_counter
+from search import fts_enabled, index_rows, INDEXED
+from cache import new_version, bump_versions, invalidate_subject_page, invalidate_quiz
+
+# Streaming import/export of the quiz bank (subjects, chapters, quizzes and questions)
+# as CSV or JSONL, for /admin/import and "flask import-data" / "flask export-data".
+# Rows are validated one at a time while the file is read and inserted in batches with
+# one commit per batch, so neither side holds the whole file in memory.
+# Parents are referenced by name (subject, chapter) or by id (quiz_id); the id column
+# of an export is informational and ignored on import.
+
+FIELDS = {
+    'subject': ['id', 'name', 'description'],
+    'chapter': ['id', 'name', 'description', 'subject'],
+    'quiz': ['id', 'chapter', 'date_of_quiz', 'time_duration', 'remarks'],
+    'question': ['id', 'quiz_id', 'question_title', 'question_statement',
+                 'option1', 'option2', 'option3', 'option4', 'correct_option'],
+}
+MODELS = {'subject': Subject, 'chapter': Chapter, 'quiz': Quiz, 'question': Question}
+FORMATS = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+class RowError(ValueError):
+    pass
+
+def format_from_filename(filename, default='csv'):
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    return extension if extension in FORMATS else default
+
+# yields (line number, row dict or None, error)
+def read_rows(stream, fmt):
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row, None
+        return
+    for line_number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield line_number, None, 'invalid JSON'
+            continue
+        if not isinstance(row, dict):
+            yield line_number, None, 'expected a JSON object'
+            continue
+        yield line_number, row, None
+
+
+def text_value(model, row, name, required=True):
+    value = row.get(name)
+    value = '' if value is None else str(value).strip()
+    if not value:
+        if required:
+            raise RowError(f'{name} is required')
+        return None
+    length = model.__table__.c[name].type.length
+    if length and len(value) > length:
+        raise RowError(f'{name} is longer than {length} characters')
+    return value
+
+def parse_duration(value):
+    try:
+        hours, minutes = map(int, value.split(':'))
+    except ValueError:
+        raise RowError('time_duration must be HH:MM')
+    if hours < 0 or not 0 <= minutes < 60 or hours * 60 + minutes == 0:
+        raise RowError('time_duration must be HH:MM')
+    return timedelta(minutes=hours * 60 + minutes)
+
+def format_duration(duration):
+    minutes = int(duration.total_seconds()) // 60
+    return f'{minutes // 60:02d}:{minutes % 60:02d}'
+
+
+# Turns the rows of one kind into column values, checking them against what is
+# already in the database (loaded once) and the rows accepted before them
+class RowValidator:
+    def __init__(self, kind):
+        self.kind = kind
+        if kind == 'subject':
+            self.names = set(db.session.scalars(select(Subject.name)))
+        elif kind == 'chapter':
+            self.names = set(db.session.scalars(select(Chapter.name)))
+            self.subject_ids = dict(db.session.execute(select(Subject.name, Subject.id)).all())
+        elif kind == 'quiz':
+            self.chapter_ids = dict(db.session.execute(select(Chapter.name, Chapter.id)).all())
+        elif kind == 'question':
+            self.quiz_ids = set(db.session.scalars(select(Quiz.id)))
+
+    def unique_name(self, model, row):
+        name = text_value(model, row, 'name')
+        if name in self.names:
+            raise RowError(f'{model.__name__.lower()} "{name}" already exists')
+        self.names.add(name)
+        return name
+
+    def subject(self, row):
+        values = {'description': text_value(Subject, row, 'description', required=False)}
+        values['name'] = self.unique_name(Subject, row)
+        return values
+
+    def chapter(self, row):
+        subject = str(row.get('subject') or '').strip()
+        if subject not in self.subject_ids:
+            raise RowError(f'subject "{subject}" does not exist')
+        values = {'description': text_value(Chapter, row, 'description', required=False),
+                  'subject_id': self.subject_ids[subject]}
+        values['name'] = self.unique_name(Chapter, row)
+        return values
+
+    def quiz(self, row):
+        chapter = str(row.get('chapter') or '').strip()
+        if chapter not in self.chapter_ids:
+            raise RowError(f'chapter "{chapter}" does not exist')
+        try:
+            date_of_quiz = datetime.strptime(str(row.get('date_of_quiz') or ''), '%Y-%m-%d').date()
+        except ValueError:
+            raise RowError('date_of_quiz must be YYYY-MM-DD')
+        return {'chapter_id': self.chapter_ids[chapter], 'date_of_quiz': date_of_quiz,
+                'time_duration': parse_duration(str(row.get('time_duration') or '')),
+                'remarks': text_value(Quiz, row, 'remarks', required=False)}
+
+    def question(self, row):
+        try:
+            quiz_id = int(row.get('quiz_id'))
+        except (TypeError, ValueError):
+            raise RowError('quiz_id must be a number')
+        if quiz_id not in self.quiz_ids:
+            raise RowError(f'quiz {quiz_id} does not exist')
+        values = {name: text_value(Question, row, name) for name in FIELDS['question'][2:]}
+        options = [values['option1'], values['option2'], values['option3'], values['option4']]
+        if values['correct_option'] not in options:
+            raise RowError('correct_option must be the text of one of the options')
+        values['quiz_id'] = quiz_id
+        return values
+
+    # yields (line number, values or None, error)
+    def validate(self, rows):
+        convert = getattr(self, self.kind)
+        for line_number, row, error in rows:
+            if error:
+                yield line_number, None, error
+                continue
+            try:
+                yield line_number, convert(row), None
+            except RowError as e:
+                yield line_number, None, str(e)
+
+
+# Bulk inserts skip the mapper events, so the search index, the counters
+# and the cache versions are updated here, in the same transaction as the rows
+def insert_batch(kind, rows):
+    model = MODELS[kind]
+    if kind in ('subject', 'quiz'):
+        version = new_version()
+        rows = [dict(row, version=version) for row in rows]
+    if kind in INDEXED and fts_enabled():
+        model, title, body = INDEXED[kind]
+        ids = db.session.scalars(insert(model).returning(model.id, sort_by_parameter_order=True), rows).all()
+        index_rows(db.session.connection(), kind, [(id, row[title], row[body]) for id, row in zip(ids, rows)])
+    else:
+        db.session.execute(insert(model), rows)
+    if kind == 'chapter':
+        for subject_id, count in Counter(row['subject_id'] for row in rows).items():
+            bump_counter(Subject.chapter_count, subject_id, count)
+            invalidate_subject_page(subject_id)
+    elif kind == 'quiz':
+        chapter_ids = {row['chapter_id'] for row in rows}
+        bump_versions(Subject, Subject.id.in_(select(Chapter.subject_id).where(Chapter.id.in_(chapter_ids))))
+    elif kind == 'question':
+        for quiz_id, count in Counter(row['quiz_id'] for row in rows).items():
+            bump_counter(Quiz.question_count, quiz_id, count)
+            invalidate_quiz(quiz_id)
+    db.session.commit()
+
+# A batch that hits a constraint (e.g. a name added concurrently) is retried row by row
+def save_batch(kind, batch, errors):
+    try:
+        insert_batch(kind, [values for line_number, values in batch])
+        return len(batch)
+    except IntegrityError:
+        db.session.rollback()
+    saved = 0
+    for line_number, values in batch:
+        try:
+            insert_batch(kind, [values])
+            saved += 1
+        except IntegrityError as e:
+            db.session.rollback()
+            errors.append((line_number, f'rejected by the database: {e.orig}'))
+    return saved
+
+# Returns (number of rows imported, [(line number, error)])
+def import_rows(kind, stream, fmt, batch_size=500):
+    imported, errors, batch = 0, [], []
+    for line_number, values, error in RowValidator(kind).validate(read_rows(stream, fmt)):
+        if error:
+            errors.append((line_number, error))
+            continue
+        batch.append((line_number, values))
+        if len(batch) >= batch_size:
+            imported += save_batch(kind, batch, errors)
+            batch = []
+    if batch:
+        imported += save_batch(kind, batch, errors)
+    return imported, errors
+
+
+def export_query(kind):
+    if kind == 'subject':
+        return select(Subject.id, Subject.name, Subject.description).order_by(Subject.id)
+    if kind == 'chapter':
+        return (select(Chapter.id, Chapter.name, Chapter.description, Subject.name.label('subject'))
+                .join(Subject, Subject.id == Chapter.subject_id).order_by(Chapter.id))
+    if kind == 'quiz':
+        return (select(Quiz.id, Chapter.name.label('chapter'), Quiz.date_of_quiz, Quiz.time_duration, Quiz.remarks)
+                .join(Chapter, Chapter.id == Quiz.chapter_id).order_by(Quiz.id))
+    return select(*[getattr(Question, name) for name in FIELDS['question']]).order_by(Question.id)
+
+def export_value(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, timedelta):
+        return format_duration(value)
+    return value
+
+# Serializes a result chunk by chunk (yield_per), yielding one string per chunk
+def stream_rows(fields, result, fmt):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == 'csv' else None
+    if writer:
+        writer.writerow(fields)
+    for chunk in result.partitions():
+        for row in chunk:
+            values = [export_value(value) for value in row]
+            if writer:
+                writer.writerow(values)
+            else:
+                buffer.write(json.dumps(dict(zip(fields, values))) + '\n')
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if writer and buffer.getvalue():
+        yield buffer.getvalue()
+
+def export_rows(kind, fmt, chunk_size=1000):
+    result = db.session.execute(export_query(kind).execution_options(yield_per=chunk_size))
+    return stream_rows(FIELDS[kind], result, fmt)
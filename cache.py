@@ -0,0 +1,221 @@
+import hashlib
+import os
+import pickle
+from collections import OrderedDict
+from threading import Lock
+from time import time
+from flask import current_app, request, session, g, make_response
+from markupsafe import Markup
+from sqlalchemy import select
+from sqlalchemy.sql import func
+from models import db, Subject, Chapter, Quiz, CatalogueVersion, bump_counter
+
+# Cache for rendered fragments and serialized catalogue data (CACHE_BACKEND: 'memory',
+# 'file' or 'none'). Keys carry the versions of what they show, so nothing is ever
+# deleted: an edit bumps the versions (invalidate_* below, called by the CRUD handlers)
+# and the next request looks up a new key. Old entries age out by TTL and size.
+#
+# Versions: Quiz.version (a quiz's pages and answer key), Subject.version (its chapter
+# list) and CatalogueVersion (anything listing quizzes across subjects, e.g. the
+# dashboard). They live in the database, so every process sees an invalidation.
+
+
+class MemoryCache:
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+# One pickle file per key, shared by the worker processes of a host and kept across restarts
+class FileCache:
+    PRUNE_EVERY = 100  # sets between size checks
+
+    def __init__(self, directory, size, ttl):
+        self.directory = directory
+        self.size = size
+        self.ttl = ttl
+        self.sets = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest() + '.cache')
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as file:
+                expires, stored_key, value = pickle.load(file)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if expires < time() or stored_key != key:
+            return None
+        return value
+
+    def set(self, key, value):
+        path = self.path(key)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as file:
+            pickle.dump((time() + self.ttl, key, value), file, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+        self.sets += 1
+        if self.sets % self.PRUNE_EVERY == 0:
+            self.prune()
+
+    # drop the least recently written files above the size bound
+    def prune(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.cache'):
+                try:
+                    entries.append((entry.stat().st_mtime, entry.path))
+                except FileNotFoundError:
+                    pass
+        entries.sort()
+        for mtime, path in entries[:max(0, len(entries) - self.size)]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+class NullCache:
+    def get(self, key):
+        return None
+
+    def set(self, key, value):
+        pass
+
+
+def get_cache():
+    cache = current_app.extensions.get('cache')
+    if cache is None:
+        backend = current_app.config['CACHE_BACKEND']
+        if backend == 'memory':
+            cache = MemoryCache(current_app.config['CACHE_SIZE'], current_app.config['CACHE_TTL'])
+        elif backend == 'file':
+            directory = current_app.config['CACHE_DIR'] or os.path.join(current_app.instance_path, 'cache')
+            cache = FileCache(directory, current_app.config['CACHE_SIZE'], current_app.config['CACHE_TTL'])
+        elif backend == 'none':
+            cache = NullCache()
+        else:
+            raise ValueError(f'Unknown CACHE_BACKEND: {backend}')
+        current_app.extensions['cache'] = cache
+    return cache
+
+# changes whenever a template file does, so a deploy never serves fragments or ETags of old templates
+def templates_fingerprint():
+    fingerprint = current_app.extensions.get('templates_fingerprint')
+    if fingerprint is None:
+        digest = hashlib.sha1()
+        folder = os.path.join(current_app.root_path, current_app.template_folder)
+        for root, dirs, files in sorted(os.walk(folder)):
+            for name in sorted(files):
+                stat = os.stat(os.path.join(root, name))
+                digest.update(f'{os.path.relpath(os.path.join(root, name), folder)}:{stat.st_mtime_ns}:{stat.st_size};'.encode())
+        fingerprint = current_app.extensions['templates_fingerprint'] = digest.hexdigest()[:12]
+    return fingerprint
+
+def cache_key(key):
+    return f'{templates_fingerprint()}:{key!r}'
+
+# compute() runs on a miss, its result must be picklable for the file backend
+def cached(key, compute):
+    cache = get_cache()
+    full_key = cache_key(key)
+    value = cache.get(full_key)
+    if value is None:
+        value = compute()
+        cache.set(full_key, value)
+    return value
+
+def cached_fragment(key, render):
+    return Markup(cached(key, render))
+
+
+# ETag of a page: its cache key plus who is looking. Pages with pending flash
+# messages get none, the messages are only shown once.
+def page_etag(key):
+    if session.get('_flashes'):
+        return None
+    user = g.get('user_info')
+    return hashlib.sha1(f'{cache_key(key)}:{user}'.encode()).hexdigest()
+
+# 304 when the browser already has this version of the page, otherwise render() it.
+# Weak comparison: compressed responses carry the ETag as a weak one (rendering.py).
+def conditional(key, render):
+    etag = page_etag(key)
+    if etag and request.if_none_match.contains_weak(etag):
+        response = make_response('', 304)
+    else:
+        response = make_response(render())
+    if etag:
+        response.set_etag(etag)
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+    return response
+
+
+# ---- versions, changed in the caller's transaction like bump_counter() ----
+
+def catalogue_version():
+    return db.session.query(CatalogueVersion.version).filter(CatalogueVersion.id == 1).scalar() or 0
+
+def bump_catalogue():
+    if db.session.query(CatalogueVersion).filter(CatalogueVersion.id == 1).update(
+            {CatalogueVersion.version: CatalogueVersion.version + 1}, synchronize_session=False):
+        return
+    # first bump: start above every existing version, see new_version()
+    start = max(db.session.query(func.max(Quiz.version)).scalar() or 0,
+                db.session.query(func.max(Subject.version)).scalar() or 0)
+    db.session.add(CatalogueVersion(id=1, version=start + 1))
+    db.session.flush()
+
+# Version for a new subject or quiz. Every version bump also bumps the catalogue, so this
+# is above any version an earlier row with the same id (SQLite reuses ids) ever had.
+def new_version():
+    bump_catalogue()
+    return catalogue_version()
+
+def bump_versions(model, condition):
+    db.session.query(model).filter(condition).update({model.version: model.version + 1}, synchronize_session=False)
+
+# its chapter list
+def invalidate_subject_page(subject_id):
+    bump_counter(Subject.version, subject_id)
+    bump_catalogue()
+
+# its chapter list and the pages of all its quizzes (they show the subject name)
+def invalidate_subject(subject_id):
+    bump_versions(Quiz, Quiz.chapter_id.in_(select(Chapter.id).where(Chapter.subject_id == subject_id)))
+    invalidate_subject_page(subject_id)
+
+# its quizzes and the chapter list of its subject
+def invalidate_chapter(chapter_id):
+    bump_versions(Quiz, Quiz.chapter_id == chapter_id)
+    bump_versions(Subject, Subject.id.in_(select(Chapter.subject_id).where(Chapter.id == chapter_id)))
+    bump_catalogue()
+
+# its pages and answer key, and the chapter list of its subject (question counts)
+def invalidate_quiz(quiz_id):
+    bump_counter(Quiz.version, quiz_id)
+    bump_versions(Subject, Subject.id.in_(
+        select(Chapter.subject_id).join(Quiz, Quiz.chapter_id == Chapter.id).where(Quiz.id == quiz_id)))
+    bump_catalogue()
@@ -0,0 +1,156 @@
+import os
+import click
+from sqlalchemy import inspect, text
+from sqlalchemy.sql import func, select
+from flask import Blueprint, current_app
+from models import db, Subject, Chapter, Quiz, Question, Score, seed_admin
+from index_audit import audit_indexes
+from search import fts_enabled, rebuild_search_index, create_search_index
+from summaries import rebuild_summaries
+from score_writer import replay_spools
+from assets import build_assets, brotli
+from deletes import run_job, stale_jobs, claim_job
+import bulk_io
+
+# Flask CLI commands, run with e.g. "flask init-db"
+bp = Blueprint('commands', __name__, cli_group=None)
+
+COUNTER_COLUMNS = {
+    'subject': ['chapter_count', 'version'],
+    'quiz': ['question_count', 'attempt_count', 'version'],
+}
+
+# create_all() does not add columns to existing tables
+def add_missing_counter_columns():
+    inspector = inspect(db.engine)
+    for table, columns in COUNTER_COLUMNS.items():
+        existing = {column['name'] for column in inspector.get_columns(table)}
+        for column in columns:
+            if column not in existing:
+                db.session.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0'))
+                click.echo(f'Added column {table}.{column}')
+    db.session.commit()
+
+@bp.cli.command('backfill-counters')
+def backfill_counters():
+    """Recompute the denormalized counter columns from the child tables."""
+    add_missing_counter_columns()
+    db.session.query(Subject).update({
+        Subject.chapter_count: select(func.count(Chapter.id)).where(Chapter.subject_id == Subject.id).scalar_subquery()
+    }, synchronize_session=False)
+    db.session.query(Quiz).update({
+        Quiz.question_count: select(func.count(Question.id)).where(Question.quiz_id == Quiz.id).scalar_subquery(),
+        Quiz.attempt_count: select(func.count(Score.id)).where(Score.quiz_id == Quiz.id).scalar_subquery(),
+    }, synchronize_session=False)
+    db.session.commit()
+    click.echo('Counters backfilled.')
+
+# create_all() skips indexes of tables that already exist
+def create_missing_indexes():
+    inspector = inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(db.engine)
+                click.echo(f'Created index {index.name}')
+
+def report_full_scans():
+    full_scans = audit_indexes()
+    for name, detail in full_scans:
+        click.echo(f'Full table scan in "{name}": {detail}')
+    if not full_scans:
+        click.echo('No full table scans in the hot queries.')
+
+@bp.cli.command('create-indexes')
+def create_indexes():
+    """Create the indexes declared on the models that are missing, then audit the hot queries."""
+    create_missing_indexes()
+    report_full_scans()
+
+@bp.cli.command('init-db')
+def init_db():
+    """Create the tables, indexes and search index (safe to run on an existing database)."""
+    db.create_all()
+    add_missing_counter_columns()
+    create_missing_indexes()
+    if fts_enabled():
+        with db.engine.begin() as connection:
+            create_search_index(connection)
+    click.echo('Database initialised.')
+    report_full_scans()
+
+@bp.cli.command('seed-admin')
+def seed_admin_command():
+    """Create the admin user (admin/admin) if there is no admin yet."""
+    admin = seed_admin()
+    click.echo(f'Admin user: {admin.username}')
+
+@bp.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    """Rebuild the admin search FTS5 index from the users, subjects, chapters and questions."""
+    if not fts_enabled():
+        click.echo('Full text search is disabled (needs SQLite and SEARCH_FTS=true).')
+        return
+    rebuild_search_index()
+    click.echo('Search index rebuilt.')
+
+@bp.cli.command('rebuild-summaries')
+def rebuild_summaries_command():
+    """Recompute the summary rollup tables from the Score table."""
+    rebuild_summaries()
+    db.session.commit()
+    click.echo('Summaries rebuilt.')
+
+@bp.cli.command('replay-score-spool')
+def replay_score_spool():
+    """Save the write-behind scores left in the spool files of stopped processes."""
+    spool_dir = current_app.config['SCORE_SPOOL_DIR'] or os.path.join(current_app.instance_path, 'score_spool')
+    if not os.path.isdir(spool_dir):
+        click.echo('No score spool found.')
+        return
+    click.echo(f'Replayed {replay_spools(spool_dir)} scores.')
+
+@bp.cli.command('resume-delete-jobs')
+def resume_delete_jobs():
+    """Finish the subject/chapter/quiz deletes whose process stopped (no progress for DELETE_JOB_STALE_AFTER seconds)."""
+    jobs = stale_jobs()
+    for job in jobs:
+        if not claim_job(job):
+            continue  # restarted by another process meanwhile
+        click.echo(f'Deleting {job.label}...')
+        run_job(job.id)
+        db.session.refresh(job)
+        click.echo(f'{job.status}: {job.deleted_rows} rows deleted.' + (f' {job.error}' if job.error else ''))
+    if not jobs:
+        click.echo('No stopped delete jobs.')
+
+@bp.cli.command('build-assets')
+def build_assets_command():
+    """Copy the static files to static/dist under content-hashed names, with gzip/brotli variants."""
+    manifest = build_assets(current_app.static_folder)
+    click.echo(f'Built {len(manifest)} static files into static/dist.')
+    if brotli is None:
+        click.echo('brotli is not installed, only gzip variants were made ("pip install brotli").')
+
+@bp.cli.command('import-data')
+@click.argument('kind', type=click.Choice(list(bulk_io.FIELDS)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(list(bulk_io.FORMATS)), help='Default: from the file extension.')
+def import_data(kind, path, fmt):
+    """Import subjects, chapters, quizzes or questions from a CSV or JSONL file."""
+    fmt = fmt or bulk_io.format_from_filename(path)
+    with open(path, 'r', encoding='utf-8-sig', newline='') as stream:
+        imported, errors = bulk_io.import_rows(kind, stream, fmt, current_app.config['IMPORT_BATCH_SIZE'])
+    for line_number, error in errors:
+        click.echo(f'line {line_number}: {error}', err=True)
+    click.echo(f'Imported {imported} rows, skipped {len(errors)} rows.')
+
+@bp.cli.command('export-data')
+@click.argument('kind', type=click.Choice(list(bulk_io.FIELDS)))
+@click.option('--format', 'fmt', type=click.Choice(list(bulk_io.FORMATS)), default='csv')
+@click.option('--output', '-o', type=click.File('w', encoding='utf-8'), default='-', help='Default: stdout.')
+def export_data(kind, fmt, output):
+    """Export subjects, chapters, quizzes or questions as CSV or JSONL."""
+    for chunk in bulk_io.export_rows(kind, fmt, current_app.config['EXPORT_CHUNK_SIZE']):
+        output.write(chunk)
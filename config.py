@@ -1,9 +1,121 @@
-
 from dotenv import load_dotenv
 import os
-from app import app
 
 load_dotenv()
-app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
-app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('SQLALCHEMY_DATABASE_URI')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = os.getenv('SQLALCHEMY_TRACK_MODIFICATIONS')
\ No newline at end of file
+
+# Typed readers for environment / .env values
+def env_str(name, default=None):
+    return os.getenv(name, default)
+
+def env_int(name, default):
+    return int(os.getenv(name, default))
+
+def env_float(name, default):
+    return float(os.getenv(name, default))
+
+def env_bool(name, default):
+    return os.getenv(name, str(default)).strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+# Settings passed to create_app(), every value can be overridden from the environment / .env
+class Config:
+    SECRET_KEY = env_str('SECRET_KEY')
+    SQLALCHEMY_DATABASE_URI = env_str('SQLALCHEMY_DATABASE_URI')
+    SQLALCHEMY_TRACK_MODIFICATIONS = env_bool('SQLALCHEMY_TRACK_MODIFICATIONS', False)
+
+    # Connection pool, used for every backend except in-memory SQLite (see engine.py)
+    DB_POOL_SIZE = env_int('DB_POOL_SIZE', 5)
+    DB_MAX_OVERFLOW = env_int('DB_MAX_OVERFLOW', 10)
+    DB_POOL_TIMEOUT = env_int('DB_POOL_TIMEOUT', 30)  # seconds to wait for a free connection
+    DB_POOL_RECYCLE = env_int('DB_POOL_RECYCLE', 1800)  # seconds, -1 to never recycle
+    DB_POOL_PRE_PING = env_bool('DB_POOL_PRE_PING', True)
+
+    # SQLite pragmas applied to every new connection
+    SQLITE_JOURNAL_MODE = env_str('SQLITE_JOURNAL_MODE', 'WAL')
+    SQLITE_SYNCHRONOUS = env_str('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_BUSY_TIMEOUT = env_int('SQLITE_BUSY_TIMEOUT', 5000)  # ms to wait on a locked database
+    SQLITE_FOREIGN_KEYS = env_bool('SQLITE_FOREIGN_KEYS', True)
+
+    # PostgreSQL server side limit per statement, ms (0 = no limit)
+    PG_STATEMENT_TIMEOUT = env_int('PG_STATEMENT_TIMEOUT', 30000)
+
+    # where in-progress quiz answers are kept: 'database' or 'memory'
+    ATTEMPT_STORE = env_str('ATTEMPT_STORE', 'database')
+    ATTEMPT_STORE_SIZE = env_int('ATTEMPT_STORE_SIZE', 1000)
+
+    # Write-behind for quiz submissions (score_writer.py): scores are spooled to a local
+    # file and saved by a background thread in batches. Off = every submit commits inline.
+    SCORE_WRITE_BEHIND = env_bool('SCORE_WRITE_BEHIND', False)
+    SCORE_QUEUE_SIZE = env_int('SCORE_QUEUE_SIZE', 10000)  # above this submits are saved inline
+    SCORE_BATCH_SIZE = env_int('SCORE_BATCH_SIZE', 200)
+    SCORE_FLUSH_INTERVAL = env_float('SCORE_FLUSH_INTERVAL', 0.2)  # seconds to wait for a batch to fill
+    SCORE_SPOOL_DIR = env_str('SCORE_SPOOL_DIR')  # default: <instance folder>/score_spool
+    SCORE_SPOOL_FSYNC = env_bool('SCORE_SPOOL_FSYNC', True)
+    SCORE_RETRY_MAX_DELAY = env_float('SCORE_RETRY_MAX_DELAY', 5.0)  # longest wait between retries of a failed batch
+
+    # bulk import/export (bulk_io.py): rows per insert batch and commit, rows per fetched chunk
+    IMPORT_BATCH_SIZE = env_int('IMPORT_BATCH_SIZE', 500)
+    IMPORT_ERRORS_SHOWN = env_int('IMPORT_ERRORS_SHOWN', 100)
+    EXPORT_CHUNK_SIZE = env_int('EXPORT_CHUNK_SIZE', 1000)
+
+    # Background subject/chapter/quiz deletes (deletes.py): rows removed per transaction, and
+    # seconds without progress after which a job's process is taken for dead and the job may be restarted
+    DELETE_CHUNK_SIZE = env_int('DELETE_CHUNK_SIZE', 2000)
+    DELETE_JOB_STALE_AFTER = env_int('DELETE_JOB_STALE_AFTER', 60)
+
+    # Rendered fragments and catalogue data (cache.py): 'memory' (per process LRU),
+    # 'file' (shared by the processes of a host, in CACHE_DIR) or 'none'
+    CACHE_BACKEND = env_str('CACHE_BACKEND', 'memory')
+    CACHE_SIZE = env_int('CACHE_SIZE', 1000)  # entries
+    CACHE_TTL = env_int('CACHE_TTL', 3600)  # seconds
+    CACHE_DIR = env_str('CACHE_DIR')  # default: <instance folder>/cache
+
+    # Password hashing (passwords.py): werkzeug method for new hashes, e.g. 'scrypt:32768:8:1' or
+    # 'pbkdf2:sha256:1000000' (hashes made with other parameters are upgraded on login),
+    # hashing threads (0 = one per CPU) and hashes allowed to wait for one
+    PASSWORD_HASH_METHOD = env_str('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+    PASSWORD_HASH_WORKERS = env_int('PASSWORD_HASH_WORKERS', 0)
+    PASSWORD_HASH_QUEUE = env_int('PASSWORD_HASH_QUEUE', 32)
+
+    # seconds browsers may cache the hashed static files made by "flask build-assets" (assets.py)
+    ASSETS_MAX_AGE = env_int('ASSETS_MAX_AGE', 31536000)
+
+    # Rendering (rendering.py): compiled templates kept on disk (default: <instance folder>/jinja_cache),
+    # long listing pages streamed in pieces of STREAM_BUFFER_SIZE characters, and text responses
+    # of at least COMPRESS_MIN_SIZE bytes compressed (brotli if installed, else gzip)
+    JINJA_BYTECODE_CACHE = env_bool('JINJA_BYTECODE_CACHE', True)
+    JINJA_CACHE_DIR = env_str('JINJA_CACHE_DIR')
+    STREAM_TEMPLATES = env_bool('STREAM_TEMPLATES', True)
+    STREAM_BUFFER_SIZE = env_int('STREAM_BUFFER_SIZE', 8192)
+    COMPRESS = env_bool('COMPRESS', True)
+    COMPRESS_MIN_SIZE = env_int('COMPRESS_MIN_SIZE', 1024)
+    COMPRESS_GZIP_LEVEL = env_int('COMPRESS_GZIP_LEVEL', 6)
+    COMPRESS_BROTLI_QUALITY = env_int('COMPRESS_BROTLI_QUALITY', 4)
+
+    # quizzes whose answer key (question id -> correct option) is kept in memory for grading
+    ANSWER_KEY_CACHE_SIZE = env_int('ANSWER_KEY_CACHE_SIZE', 256)
+
+    ADMIN_PER_PAGE = env_int('ADMIN_PER_PAGE', 50)  # admin lists, keyset paginated
+    LOOKUP_LIMIT = env_int('LOOKUP_LIMIT', 20)  # options returned per typeahead lookup
+
+    SCORES_PER_PAGE = env_int('SCORES_PER_PAGE', 20)
+    QUIZZES_PER_PAGE = env_int('QUIZZES_PER_PAGE', 20)
+
+    # seconds the auth decorators may reuse a user's (is_admin, name) without a query
+    USER_CACHE_TTL = env_int('USER_CACHE_TTL', 30)
+    USER_CACHE_SIZE = env_int('USER_CACHE_SIZE', 10000)  # users
+
+    # Request/SQL instrumentation (metrics.py), shown on /admin/metrics and /metrics (Prometheus).
+    # A request running more than METRICS_QUERY_THRESHOLD statements logs them as a warning.
+    METRICS = env_bool('METRICS', False)
+    METRICS_QUERY_THRESHOLD = env_int('METRICS_QUERY_THRESHOLD', 20)
+    METRICS_SLOWEST = env_int('METRICS_SLOWEST', 20)  # slowest statements kept
+    METRICS_TOKEN = env_str('METRICS_TOKEN')  # when set, /metrics needs "Authorization: Bearer <token>", else an admin session
+
+    # EXPLAIN the hot queries when the app is created and warn about full table scans
+    # ("flask init-db" and "flask create-indexes" always run the check)
+    INDEX_AUDIT = env_bool('INDEX_AUDIT', False)
+
+    # admin search uses the SQLite FTS5 index, set to false to fall back to ILIKE
+    SEARCH_FTS = env_bool('SEARCH_FTS', True)
+    SEARCH_PER_PAGE = env_int('SEARCH_PER_PAGE', 20)
@@ -0,0 +1,203 @@
+import os
+import socket
+from datetime import datetime, timedelta
+from threading import Thread
+from flask import current_app
+from sqlalchemy import delete, select
+from sqlalchemy.sql import func
+from models import db, Subject, Chapter, Quiz, Question, Score, Attempt, AttemptAnswer, DeleteJob, bump_counter
+from search import fts_enabled, remove_rows
+from summaries import forget_scores, refresh_top_scores
+from grading import forget_answer_key
+from cache import bump_catalogue, invalidate_subject_page, invalidate_quiz
+
+# Deleting a subject, chapter or quiz runs as a background job (one thread per job)
+# instead of session.delete(), which would load every chapter, quiz, question and
+# score underneath into memory. The job deletes bottom up, one quiz at a time, in
+# chunks of DELETE_CHUNK_SIZE rows with one commit per chunk, so memory stays flat and
+# other requests only ever wait for one short transaction. Progress is kept in its
+# DeleteJob row, which any worker process can show. Every chunk also renews the job's
+# heartbeat: a job that has made no progress for DELETE_JOB_STALE_AFTER seconds lost
+# its process (e.g. a gunicorn worker recycled after max_requests) and is restarted by
+# the next delete of its target, the Restart button of its page or "flask
+# resume-delete-jobs". Deleting is idempotent, a restarted job carries on from the rows
+# that are left.
+#
+# Bulk deletes skip the mapper events, so the search index, the counters, the cache
+# versions and the summary rollups are updated here, in the same transactions as the rows.
+
+def quiz_ids(kind, target_id):
+    if kind == 'quiz':
+        return [target_id]
+    if kind == 'chapter':
+        condition = Quiz.chapter_id == target_id
+    else:
+        condition = Quiz.chapter_id.in_(select(Chapter.id).where(Chapter.subject_id == target_id))
+    return db.session.scalars(select(Quiz.id).where(condition).order_by(Quiz.id)).all()
+
+def chapter_ids(kind, target_id):
+    if kind == 'quiz':
+        return []
+    if kind == 'chapter':
+        return [target_id]
+    return db.session.scalars(select(Chapter.id).where(Chapter.subject_id == target_id).order_by(Chapter.id)).all()
+
+def subject_of(kind, target_id):
+    if kind == 'subject':
+        return target_id
+    query = db.session.query(Chapter.subject_id)
+    if kind == 'quiz':
+        query = query.join(Quiz, Quiz.chapter_id == Chapter.id).filter(Quiz.id == target_id)
+    else:
+        query = query.filter(Chapter.id == target_id)
+    return query.scalar()
+
+# rows under the quizzes, for the progress bar
+def count_rows(quizzes):
+    total = len(quizzes)
+    for model in (Score, Attempt, Question):
+        total += db.session.query(func.count(model.id)).filter(model.quiz_id.in_(quizzes)).scalar()
+    total += (db.session.query(func.count(AttemptAnswer.id))
+              .join(Attempt, Attempt.id == AttemptAnswer.attempt_id)
+              .filter(Attempt.quiz_id.in_(quizzes)).scalar())
+    return total
+
+def worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+def stale_before():
+    return datetime.now() - timedelta(seconds=current_app.config['DELETE_JOB_STALE_AFTER'])
+
+def is_stale(job):
+    return job.status in ('queued', 'running') and job.heartbeat_at < stale_before()
+
+def progress(job, deleted):
+    db.session.query(DeleteJob).filter(DeleteJob.id == job.id).update(
+        {DeleteJob.deleted_rows: DeleteJob.deleted_rows + deleted, DeleteJob.heartbeat_at: datetime.now()},
+        synchronize_session=False)
+    db.session.commit()
+
+def unindex(kind):
+    def remove(ids):
+        if fts_enabled():
+            remove_rows(db.session.connection(), kind, ids)
+    return remove
+
+# deletes chunk after chunk of `model` rows whose ids `ids_of` selects, until none are
+# left; before(ids) runs first, in the chunk's transaction
+def delete_chunks(job, model, ids_of, before=None):
+    chunk_size = current_app.config['DELETE_CHUNK_SIZE']
+    while True:
+        ids = db.session.scalars(ids_of.limit(chunk_size)).all()
+        if not ids:
+            return
+        if before:
+            before(ids)
+        db.session.execute(delete(model).where(model.id.in_(ids)).execution_options(synchronize_session=False))
+        progress(job, len(ids))
+
+def delete_quiz_rows(job, quiz_id):
+    delete_chunks(job, AttemptAnswer, select(AttemptAnswer.id).join(Attempt, Attempt.id == AttemptAnswer.attempt_id)
+                  .where(Attempt.quiz_id == quiz_id))
+    delete_chunks(job, Attempt, select(Attempt.id).where(Attempt.quiz_id == quiz_id))
+    delete_chunks(job, Score, select(Score.id).where(Score.quiz_id == quiz_id), forget_scores)
+    delete_chunks(job, Question, select(Question.id).where(Question.quiz_id == quiz_id), unindex('question'))
+    invalidate_quiz(quiz_id)
+    db.session.execute(delete(Quiz).where(Quiz.id == quiz_id).execution_options(synchronize_session=False))
+    progress(job, 1)
+    forget_answer_key(quiz_id)
+
+def delete_chapter_row(chapter_id):
+    subject_id = db.session.query(Chapter.subject_id).filter(Chapter.id == chapter_id).scalar()
+    if subject_id is None:
+        return
+    bump_counter(Subject.chapter_count, subject_id, -1)
+    invalidate_subject_page(subject_id)
+    if fts_enabled():
+        remove_rows(db.session.connection(), 'chapter', [chapter_id])
+    db.session.execute(delete(Chapter).where(Chapter.id == chapter_id).execution_options(synchronize_session=False))
+
+def run_job(job_id):
+    job = db.session.get(DeleteJob, job_id)
+    db.session.query(DeleteJob).filter(DeleteJob.id == job_id).update(
+        {DeleteJob.status: 'running', DeleteJob.deleted_rows: 0, DeleteJob.error: None, DeleteJob.finished_at: None,
+         DeleteJob.owner: worker_id(), DeleteJob.heartbeat_at: datetime.now()}, synchronize_session=False)
+    db.session.commit()
+    try:
+        quizzes = quiz_ids(job.kind, job.target_id)
+        chapters = chapter_ids(job.kind, job.target_id)
+        subject_id = subject_of(job.kind, job.target_id)
+        db.session.query(DeleteJob).filter(DeleteJob.id == job_id).update(
+            {DeleteJob.total_rows: count_rows(quizzes) + len(chapters) + (job.kind == 'subject'),
+             DeleteJob.heartbeat_at: datetime.now()}, synchronize_session=False)
+        db.session.commit()
+        for quiz_id in quizzes:
+            delete_quiz_rows(job, quiz_id)
+        for chapter_id in chapters:
+            delete_chapter_row(chapter_id)
+            progress(job, 1)
+        if job.kind == 'subject':
+            if fts_enabled():
+                remove_rows(db.session.connection(), 'subject', [job.target_id])
+            db.session.execute(delete(Subject).where(Subject.id == job.target_id)
+                               .execution_options(synchronize_session=False))
+            bump_catalogue()
+            progress(job, 1)
+        else:
+            refresh_top_scores([subject_id])  # the deleted scores may have held it
+        db.session.query(DeleteJob).filter(DeleteJob.id == job_id).update(
+            {DeleteJob.status: 'done', DeleteJob.finished_at: datetime.now()}, synchronize_session=False)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.exception('Delete job %s failed', job_id)
+        db.session.query(DeleteJob).filter(DeleteJob.id == job_id).update(
+            {DeleteJob.status: 'failed', DeleteJob.error: str(e), DeleteJob.finished_at: datetime.now()},
+            synchronize_session=False)
+        db.session.commit()
+
+def run_in_thread(app, job_id):
+    with app.app_context():
+        run_job(job_id)
+
+def start_thread(job):
+    Thread(target=run_in_thread, args=(current_app._get_current_object(), job.id), daemon=True,
+           name=f'delete-job-{job.id}').start()
+
+# Takes over a job that failed or lost its process, True if this process got it (the
+# update only matches while the job is still stale, so two processes can't both win)
+def claim_job(job):
+    claimed = db.session.query(DeleteJob).filter(
+        DeleteJob.id == job.id,
+        (DeleteJob.status == 'failed')
+        | (DeleteJob.status.in_(('queued', 'running')) & (DeleteJob.heartbeat_at < stale_before())),
+    ).update({DeleteJob.status: 'queued', DeleteJob.owner: worker_id(), DeleteJob.heartbeat_at: datetime.now()},
+             synchronize_session=False)
+    db.session.commit()
+    return claimed == 1
+
+# Queues the delete and starts it in the background, returns its DeleteJob. A target
+# that is already being deleted gets the job that is running, restarted if it is stale.
+def start_delete_job(kind, target_id, label):
+    job = (DeleteJob.query.filter(DeleteJob.kind == kind, DeleteJob.target_id == target_id,
+                                  DeleteJob.status.in_(('queued', 'running')))
+           .order_by(DeleteJob.id.desc()).first())
+    if job:
+        restart_job(job)
+        return job
+    job = DeleteJob(kind=kind, target_id=target_id, label=label, owner=worker_id())
+    db.session.add(job)
+    db.session.commit()
+    start_thread(job)
+    return job
+
+# starts a failed or stale job again, False if it is neither
+def restart_job(job):
+    if not claim_job(job):
+        return False
+    start_thread(job)
+    return True
+
+def stale_jobs():
+    return (DeleteJob.query.filter(DeleteJob.status.in_(('queued', 'running')), DeleteJob.heartbeat_at < stale_before())
+            .order_by(DeleteJob.id).all())
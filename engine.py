@@ -0,0 +1,39 @@
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+# Per backend SQLAlchemy engine tuning, built from the DB_*/SQLITE_*/PG_* config values.
+
+def is_memory_sqlite(url):
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+def engine_options(config):
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    if is_memory_sqlite(url):
+        return {}  # flask-sqlalchemy gives in-memory SQLite a single shared connection
+    options = {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+    }
+    if url.get_backend_name() == 'sqlite':
+        # busy_timeout is set as a pragma, the driver timeout is in seconds
+        options['connect_args'] = {'timeout': config['SQLITE_BUSY_TIMEOUT'] / 1000}
+    elif url.get_backend_name() == 'postgresql' and config['PG_STATEMENT_TIMEOUT']:
+        options['connect_args'] = {'options': f"-c statement_timeout={config['PG_STATEMENT_TIMEOUT']}"}
+    return options
+
+def apply_sqlite_pragmas(engine, config):
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if not is_memory_sqlite(engine.url):
+            cursor.execute(f"PRAGMA journal_mode={config['SQLITE_JOURNAL_MODE']}")
+        cursor.execute(f"PRAGMA synchronous={config['SQLITE_SYNCHRONOUS']}")
+        cursor.execute(f"PRAGMA busy_timeout={int(config['SQLITE_BUSY_TIMEOUT'])}")
+        cursor.execute(f"PRAGMA foreign_keys={'ON' if config['SQLITE_FOREIGN_KEYS'] else 'OFF'}")
+        cursor.close()
@@ -0,0 +1,73 @@
+from datetime import datetime
+from sqlalchemy import select, func
+from models import User, Score, Quiz, Chapter, Subject, db
+from bulk_io import stream_rows
+
+# Streamed CSV/JSONL exports of users and quiz results for admins. The rows are
+# fetched with yield_per (a server side cursor where the database has one) and
+# written chunk by chunk, so memory use does not grow with the table.
+
+USER_FIELDS = ['id', 'username', 'name', 'qualification', 'dob', 'is_admin']
+SCORE_FIELDS = ['id', 'user_id', 'username', 'quiz_id', 'chapter', 'subject', 'score', 'total', 'date_attempted']
+RESULT_FIELDS = ['user_id', 'username', 'name', 'attempts', 'best_score', 'average_score', 'total', 'last_attempted']
+
+# from/to (YYYY-MM-DD, inclusive), quiz_id and subject_id from the query string,
+# raises ValueError with a message for the admin
+def parse_filters(args):
+    filters = {}
+    for name in ('from', 'to'):
+        if args.get(name):
+            try:
+                filters[name] = datetime.strptime(args[name], '%Y-%m-%d').date()
+            except ValueError:
+                raise ValueError(f'"{name}" must be a date (YYYY-MM-DD)')
+    for name in ('quiz_id', 'subject_id'):
+        if args.get(name):
+            try:
+                filters[name] = int(args[name])
+            except ValueError:
+                raise ValueError(f'"{name}" must be a number')
+    return filters
+
+def score_conditions(filters):
+    conditions = []
+    if 'from' in filters:
+        conditions.append(Score.date_attempted >= filters['from'])
+    if 'to' in filters:
+        conditions.append(Score.date_attempted <= filters['to'])
+    if 'quiz_id' in filters:
+        conditions.append(Score.quiz_id == filters['quiz_id'])
+    if 'subject_id' in filters:
+        conditions.append(Chapter.subject_id == filters['subject_id'])
+    return conditions
+
+def users_export(fmt, chunk_size=1000):
+    statement = select(*[getattr(User, name) for name in USER_FIELDS]).order_by(User.id)
+    return stream_rows(USER_FIELDS, db.session.execute(statement.execution_options(yield_per=chunk_size)), fmt)
+
+def scores_export(fmt, filters, chunk_size=1000):
+    statement = (
+        select(Score.id, Score.user_id, User.username, Score.quiz_id, Chapter.name, Subject.name,
+               Score.score, Quiz.question_count, Score.date_attempted)
+        .join(User, User.id == Score.user_id)
+        .join(Quiz, Quiz.id == Score.quiz_id)
+        .join(Chapter, Chapter.id == Quiz.chapter_id)
+        .join(Subject, Subject.id == Chapter.subject_id)
+        .where(*score_conditions(filters))
+        .order_by(Score.id)
+    )
+    return stream_rows(SCORE_FIELDS, db.session.execute(statement.execution_options(yield_per=chunk_size)), fmt)
+
+# one row per user who attempted the quiz, only the date filters apply
+def quiz_results_export(quiz_id, fmt, filters, chunk_size=1000):
+    statement = (
+        select(User.id, User.username, User.name, func.count(Score.id), func.max(Score.score),
+               func.round(func.avg(Score.score), 2), Quiz.question_count, func.max(Score.date_attempted))
+        .join(Score, Score.user_id == User.id)
+        .join(Quiz, Quiz.id == Score.quiz_id)
+        .where(Score.quiz_id == quiz_id,
+               *score_conditions({name: filters[name] for name in ('from', 'to') if name in filters}))
+        .group_by(User.id, User.username, User.name, Quiz.question_count)
+        .order_by(User.id)
+    )
+    return stream_rows(RESULT_FIELDS, db.session.execute(statement.execution_options(yield_per=chunk_size)), fmt)
@@ -0,0 +1,65 @@
+from collections import OrderedDict, namedtuple
+from datetime import datetime
+from threading import Lock
+from flask import current_app
+from models import db, Score, Quiz, Question, bump_counter
+from summaries import record_attempt
+from score_writer import get_score_writer
+
+# question ids in quiz order and str(question.id) -> correct option
+AnswerKey = namedtuple('AnswerKey', ['question_ids', 'correct'])
+
+# Answer keys per (quiz id, Quiz.version); a question/quiz change bumps the version,
+# so stale keys are never hit and just age out of the LRU.
+_answer_keys = OrderedDict()
+_answer_keys_lock = Lock()
+
+def answer_key(quiz):
+    cache_key = (quiz.id, quiz.version)
+    with _answer_keys_lock:
+        key = _answer_keys.get(cache_key)
+        if key is not None:
+            _answer_keys.move_to_end(cache_key)
+            return key
+    rows = (
+        db.session.query(Question.id, Question.correct_option)
+        .filter(Question.quiz_id == quiz.id)
+        .order_by(Question.id)
+        .all()
+    )
+    key = AnswerKey(tuple(question_id for question_id, correct_option in rows),
+                    {str(question_id): correct_option for question_id, correct_option in rows})
+    with _answer_keys_lock:
+        _answer_keys[cache_key] = key
+        while len(_answer_keys) > current_app.config['ANSWER_KEY_CACHE_SIZE']:
+            _answer_keys.popitem(last=False)
+    return key
+
+def forget_answer_key(quiz_id):
+    with _answer_keys_lock:
+        for cache_key in [cache_key for cache_key in _answer_keys if cache_key[0] == quiz_id]:
+            del _answer_keys[cache_key]
+
+# answers maps str(question.id) -> selected option
+def grade(key, answers):
+    score = 0
+    for question_id, correct_option in key.correct.items():
+        selected_answer = answers.get(question_id)
+        if selected_answer and selected_answer == correct_option:
+            score += 1
+    return score
+
+# Score row, attempt counter and summary rollups in one transaction.
+# With SCORE_WRITE_BEHIND the row is queued for the background writer instead and None is returned.
+def record_score(user_id, quiz_id, score):
+    date_attempted = datetime.now().date()
+    if current_app.config['SCORE_WRITE_BEHIND'] and get_score_writer().submit(user_id, quiz_id, score, date_attempted):
+        return None
+    score_record = Score(user_id=user_id,
+                         quiz_id=quiz_id, score=score,
+                         date_attempted=date_attempted)
+    db.session.add(score_record)
+    bump_counter(Quiz.attempt_count, quiz_id)
+    record_attempt(user_id, quiz_id, score, score_record.date_attempted)
+    db.session.commit()
+    return score_record
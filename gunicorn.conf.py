@@ -0,0 +1,46 @@
+# gunicorn settings, read by "gunicorn wsgi:app" from the project folder.
+# Like the app config, every value can be overridden from the environment / .env.
+
+import multiprocessing
+import os
+from dotenv import load_dotenv
+
+# The processes already spread over the CPUs, one password hashing thread each (see
+# passwords.py). Set before config is imported, which reads it into Config; .env is
+# loaded first so a value there still wins.
+load_dotenv()
+os.environ.setdefault('PASSWORD_HASH_WORKERS', '1')
+
+from config import env_int, env_str, env_bool
+
+
+bind = env_str('WSGI_BIND', '0.0.0.0:8000')
+
+# The app is imported once in the master and the workers are forked from it: they
+# share its memory copy-on-write and start serving without importing anything.
+preload_app = env_bool('WSGI_PRELOAD', True)
+
+# processes for the CPU, threads to keep serving while requests wait on the database
+worker_class = 'gthread'
+workers = env_int('WSGI_WORKERS', multiprocessing.cpu_count() * 2 + 1)
+threads = env_int('WSGI_THREADS', 4)
+timeout = env_int('WSGI_TIMEOUT', 30)
+graceful_timeout = env_int('WSGI_GRACEFUL_TIMEOUT', 30)
+keepalive = env_int('WSGI_KEEPALIVE', 5)
+
+# a worker is replaced after this many requests, plus a random jitter so they don't all restart together
+max_requests = env_int('WSGI_MAX_REQUESTS', 1000)
+max_requests_jitter = env_int('WSGI_MAX_REQUESTS_JITTER', 100)
+
+accesslog = env_str('WSGI_ACCESS_LOG')  # '-' for stdout
+
+
+def post_fork(server, worker):
+    if not server.cfg.preload_app:
+        return
+    # connections the master opened (e.g. INDEX_AUDIT) must not be shared: the worker
+    # starts a pool of its own, close=False leaves the master's connections alone
+    from wsgi import app
+    from models import db
+    with app.app_context():
+        db.engine.dispose(close=False)
@@ -0,0 +1,49 @@
+import re
+from datetime import date
+from sqlalchemy import select
+from flask import current_app
+from models import db, Score, Chapter, Quiz, Question
+import queries
+
+# Runs EXPLAIN QUERY PLAN (SQLite only) on the hot queries and warns when
+# one of them falls back to a full table scan, i.e. an index is missing.
+
+SCAN = re.compile(r'^SCAN (\w+)$')
+
+def hot_queries():
+    today = date.today()
+    return {
+        'upcoming quizzes': select(Quiz.id).where(Quiz.date_of_quiz >= today),
+        'quizzes of chapter': select(Quiz.id).where(Quiz.chapter_id == 1),
+        'chapters of subject': select(Chapter.id).where(Chapter.subject_id == 1),
+        'questions of quiz': select(Question.id).where(Question.quiz_id == 1),
+        'scores of quiz': select(Score.id).where(Score.quiz_id == 1),
+        'user attempts of quiz': select(Score.id).where(
+            Score.user_id == 1, Score.quiz_id == 1, Score.date_attempted <= today),
+        'user score page': queries.user_score_query(1).statement,
+    }
+
+def explain(connection, statement):
+    compiled = statement.compile(dialect=connection.dialect)
+    params = tuple(
+        value.isoformat() if isinstance(value, date) else value
+        for value in (compiled.params[name] for name in compiled.positiontup)
+    )
+    return [row[-1] for row in connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + str(compiled), params)]
+
+# returns (query name, plan line) for every full scan of a real table
+def audit_indexes():
+    if db.engine.dialect.name != 'sqlite':
+        return []
+    tables = set(db.metadata.tables)
+    full_scans = []
+    with db.engine.connect() as connection:
+        for name, statement in hot_queries().items():
+            for detail in explain(connection, statement):
+                match = SCAN.match(detail)
+                if match and match.group(1) in tables:
+                    full_scans.append((name, detail))
+    for name, detail in full_scans:
+        current_app.logger.warning('Full table scan in hot query "%s": %s', name, detail)
+    return full_scans
+
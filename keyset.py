@@ -0,0 +1,55 @@
+import base64
+import json
+from sqlalchemy import tuple_
+
+# Keyset (seek) pagination for the admin lists: instead of OFFSET, a page starts
+# right after (or ends right before) the key of the row that was last shown,
+# so every page costs one indexed range scan and rows added or deleted meanwhile
+# never shift the pages. The cursor in the URL is that key, encoded.
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+# None for a missing or tampered cursor, which then just shows the first page
+def decode_cursor(cursor, length):
+    if not cursor:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except ValueError:
+        return None
+    if not isinstance(values, list) or len(values) != length:
+        return None
+    return values
+
+
+class KeysetPage:
+    def __init__(self, items, columns, has_next, has_prev):
+        self.items = items
+        self.has_next = has_next
+        self.has_prev = has_prev
+        keys = [column.key for column in columns]
+        self.next_cursor = encode_cursor([getattr(items[-1], key) for key in keys]) if items else None
+        self.prev_cursor = encode_cursor([getattr(items[0], key) for key in keys]) if items else None
+
+    def __iter__(self):
+        return iter(self.items)
+
+# columns must be unique together (end with the primary key) and are sorted ascending.
+# after/before are cursors from a previous page, before wins when both are given.
+def keyset_paginate(query, columns, after=None, before=None, per_page=20):
+    key = tuple_(*columns) if len(columns) > 1 else columns[0]
+    before_values = decode_cursor(before, len(columns))
+    after_values = decode_cursor(after, len(columns))
+    query = query.order_by(None)
+    if before_values is not None:
+        bound = tuple_(*before_values) if len(columns) > 1 else before_values[0]
+        rows = query.filter(key < bound).order_by(*[column.desc() for column in columns]).limit(per_page + 1).all()
+        if rows:  # otherwise everything before it is gone, show the first page
+            return KeysetPage(rows[:per_page][::-1], columns, has_next=True, has_prev=len(rows) > per_page)
+        after_values = None
+    if after_values is not None:
+        bound = tuple_(*after_values) if len(columns) > 1 else after_values[0]
+        query = query.filter(key > bound)
+    rows = query.order_by(*columns).limit(per_page + 1).all()
+    return KeysetPage(rows[:per_page], columns, has_next=len(rows) > per_page, has_prev=after_values is not None)
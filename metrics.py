@@ -0,0 +1,145 @@
+import heapq
+from bisect import bisect_left
+from collections import Counter
+from threading import Lock
+from time import perf_counter
+from flask import g, has_app_context, request, request_started, request_finished, got_request_exception
+from sqlalchemy import event
+from models import db
+
+# Opt-in (METRICS=true) request and SQL instrumentation. Flask request signals time each
+# request, the engine's cursor events count and time its statements. Totals are kept per
+# endpoint in this process and shown on /admin/metrics and, in Prometheus text format,
+# on /metrics. A request running more than METRICS_QUERY_THRESHOLD statements logs them,
+# which is how an N+1 query shows up.
+
+# request latency histogram buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class EndpointStats:
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)  # the last one is +Inf
+        self.count = 0
+        self.seconds = 0.0
+        self.queries = 0
+        self.max_queries = 0
+        self.sql_seconds = 0.0
+        self.over_threshold = 0
+
+    # upper bound of the bucket holding the q-quantile, None above the last bucket
+    def quantile(self, q):
+        seen = 0
+        for bound, count in zip(BUCKETS + (None,), self.buckets):
+            seen += count
+            if seen >= q * self.count:
+                return bound
+        return None
+
+
+class Metrics:
+    def __init__(self, app):
+        self.app = app
+        self.threshold = app.config['METRICS_QUERY_THRESHOLD']
+        self.slowest_kept = app.config['METRICS_SLOWEST']
+        self.endpoints = {}
+        self.slowest = []  # min-heap of (seconds, statement, endpoint)
+        self.lock = Lock()
+
+    def record(self, endpoint, seconds, statements):
+        sql_seconds = sum(duration for statement, duration in statements)
+        over = len(statements) > self.threshold
+        with self.lock:
+            stats = self.endpoints.setdefault(endpoint, EndpointStats())
+            stats.buckets[bisect_left(BUCKETS, seconds)] += 1
+            stats.count += 1
+            stats.seconds += seconds
+            stats.queries += len(statements)
+            stats.max_queries = max(stats.max_queries, len(statements))
+            stats.sql_seconds += sql_seconds
+            stats.over_threshold += over
+            for statement, duration in statements:
+                if len(self.slowest) < self.slowest_kept:
+                    heapq.heappush(self.slowest, (duration, statement, endpoint))
+                elif duration > self.slowest[0][0]:
+                    heapq.heapreplace(self.slowest, (duration, statement, endpoint))
+        if over:
+            repeated = Counter(statement for statement, duration in statements).most_common()
+            self.app.logger.warning(
+                '%s ran %s SQL statements (threshold %s):\n%s', endpoint, len(statements), self.threshold,
+                '\n'.join(f'{count} x {statement}' for statement, count in repeated))
+
+    def snapshot(self):
+        with self.lock:
+            endpoints = sorted(self.endpoints.items())
+            slowest = sorted(self.slowest, reverse=True)
+        return endpoints, slowest
+
+    def prometheus_text(self):
+        endpoints = self.snapshot()[0]
+        lines = [
+            '# HELP quizmaster_request_duration_seconds Request latency by endpoint.',
+            '# TYPE quizmaster_request_duration_seconds histogram',
+        ]
+        for endpoint, stats in endpoints:
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ('+Inf',), stats.buckets):
+                cumulative += count
+                lines.append(f'quizmaster_request_duration_seconds_bucket{{endpoint="{endpoint}",le="{bound}"}} {cumulative}')
+            lines.append(f'quizmaster_request_duration_seconds_sum{{endpoint="{endpoint}"}} {stats.seconds:.6f}')
+            lines.append(f'quizmaster_request_duration_seconds_count{{endpoint="{endpoint}"}} {stats.count}')
+        for name, help, value in (
+            ('sql_queries_total', 'SQL statements run by requests.', lambda stats: stats.queries),
+            ('sql_duration_seconds_total', 'Time spent in SQL statements.', lambda stats: f'{stats.sql_seconds:.6f}'),
+            ('requests_over_query_threshold_total', 'Requests that ran more statements than METRICS_QUERY_THRESHOLD.',
+             lambda stats: stats.over_threshold),
+        ):
+            lines.append(f'# HELP quizmaster_{name} {help}')
+            lines.append(f'# TYPE quizmaster_{name} counter')
+            for endpoint, stats in endpoints:
+                lines.append(f'quizmaster_{name}{{endpoint="{endpoint}"}} {value(stats)}')
+        hasher = self.app.extensions.get('password_hasher')
+        if hasher is not None:
+            lines.extend(hasher.prometheus_lines())
+        return '\n'.join(lines) + '\n'
+
+
+def started(app, **extra):
+    g.metrics_start = perf_counter()
+    g.metrics_statements = []
+
+def finished(app, response=None, **extra):
+    if 'metrics_start' not in g:
+        return
+    endpoint, start = request.endpoint or 'unmatched', g.pop('metrics_start')
+    if response is not None and response.is_streamed:
+        # a streamed page (rendering.stream_page) is rendered, and runs its lazy queries,
+        # while the body is sent: record it once that is done. g.metrics_statements stays
+        # in place so those statements are still added to the list.
+        statements = g.metrics_statements
+        response.call_on_close(lambda: app.extensions['metrics'].record(endpoint, perf_counter() - start, statements))
+        return
+    app.extensions['metrics'].record(endpoint, perf_counter() - start, g.pop('metrics_statements'))
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('metrics_query_start', []).append(perf_counter())
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    duration = perf_counter() - conn.info['metrics_query_start'].pop()
+    # only statements of a request being timed (not CLI commands or the score writer)
+    if has_app_context() and 'metrics_statements' in g:
+        g.metrics_statements.append((statement, duration))
+
+def handle_error(context):
+    if context.connection is not None and context.connection.info.get('metrics_query_start'):
+        context.connection.info['metrics_query_start'].pop()
+
+def init_metrics(app):
+    app.extensions['metrics'] = Metrics(app)
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        event.listen(db.engine, 'after_cursor_execute', after_cursor_execute)
+        event.listen(db.engine, 'handle_error', handle_error)
+    request_started.connect(started, app)
+    request_finished.connect(finished, app)
+    got_request_exception.connect(finished, app)
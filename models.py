@@ -1,9 +1,8 @@
-from app import app
 from flask_sqlalchemy import SQLAlchemy
 from datetime import timedelta, datetime
 from werkzeug.security import generate_password_hash, check_password_hash
 
-db = SQLAlchemy(app)
+db = SQLAlchemy()
 
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -15,11 +14,15 @@ class User(db.Model):
     dob= db.Column(db.Date, nullable=True)
 
     scores = db.relationship('Score', backref='user', lazy=True, cascade='all, delete-orphan')
+    attempts = db.relationship('Attempt', backref='user', lazy=True, cascade='all, delete-orphan')
 
 class Subject(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(80), unique=True, nullable=False)
     description = db.Column(db.String(256), nullable=True)
+    chapter_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # bumped whenever its chapter list changes, see cache.py
+    version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     chapters = db.relationship('Chapter', backref='subject', lazy=True, cascade='all, delete-orphan')
 
@@ -31,15 +34,28 @@ class Chapter(db.Model):
 
     quizzes = db.relationship('Quiz', backref='chapter', lazy=True, cascade='all, delete-orphan')
 
+    __table_args__ = (db.Index('ix_chapter_subject_id', 'subject_id'),)
+
 class Quiz(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     date_of_quiz = db.Column(db.Date, nullable=False)
     time_duration = db.Column(db.Interval, nullable=False)
     remarks = db.Column(db.String(256), nullable=True)
     chapter_id = db.Column(db.Integer, db.ForeignKey('chapter.id', ondelete='CASCADE'), nullable=False)
+    # denormalized counters, kept up to date by bump_counter()
+    question_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    attempt_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # bumped whenever it or its questions change, invalidates its cached pages and answer key (cache.py)
+    version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
-    questions = db.relationship('Question', backref='quiz', lazy=True, cascade='all, delete-orphan')
+    questions = db.relationship('Question', backref='quiz', lazy=True, cascade='all, delete-orphan', order_by='Question.id')
     scores = db.relationship('Score', backref='quiz', lazy=True, cascade='all, delete-orphan')
+    attempts = db.relationship('Attempt', backref='quiz', lazy=True, cascade='all, delete-orphan')
+
+    __table_args__ = (
+        db.Index('ix_quiz_chapter_id', 'chapter_id'),
+        db.Index('ix_quiz_date_of_quiz', 'date_of_quiz'),
+    )
 
 class Question(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -52,6 +68,10 @@ class Question(db.Model):
     option4 = db.Column(db.String(100), nullable=False)
     correct_option = db.Column(db.String(100), nullable=False)
 
+    attempt_answers = db.relationship('AttemptAnswer', backref='question', lazy=True, cascade='all, delete-orphan')
+
+    __table_args__ = (db.Index('ix_question_quiz_id', 'quiz_id'),)
+
 
 
 class Score(db.Model):
@@ -62,10 +82,88 @@ class Score(db.Model):
     remarks = db.Column(db.String(256), nullable=True)
     date_attempted = db.Column(db.Date, nullable=False)
 
+    # user's history per quiz (score page, attempt numbering) and per quiz joins (summaries)
+    __table_args__ = (
+        db.Index('ix_score_user_quiz_date', 'user_id', 'quiz_id', 'date_attempted'),
+        db.Index('ix_score_quiz_id', 'quiz_id'),
+    )
 
-with app.app_context():
-    db.create_all()
+# In-progress quiz attempt, the answers live here instead of the session cookie
+class Attempt(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id', ondelete='CASCADE'), nullable=False)
+    remaining_time = db.Column(db.Integer, nullable=False)
+    started_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+
+    answers = db.relationship('AttemptAnswer', backref='attempt', lazy=True, cascade='all, delete-orphan')
+
+    __table_args__ = (db.Index('ix_attempt_user_quiz', 'user_id', 'quiz_id'),)
+
+class AttemptAnswer(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    attempt_id = db.Column(db.Integer, db.ForeignKey('attempt.id', ondelete='CASCADE'), nullable=False)
+    question_id = db.Column(db.Integer, db.ForeignKey('question.id', ondelete='CASCADE'), nullable=False)
+    selected_answer = db.Column(db.String(100), nullable=False, default='')
 
+    __table_args__ = (db.UniqueConstraint('attempt_id', 'question_id'),)
+
+
+# Rollups read by the summary pages, updated with every new Score (see summaries.py)
+class SubjectStats(db.Model):
+    subject_id = db.Column(db.Integer, db.ForeignKey('subject.id', ondelete='CASCADE'), primary_key=True)
+    attempt_count = db.Column(db.Integer, nullable=False, default=0)
+    top_score = db.Column(db.Integer, nullable=False, default=0)
+
+class UserSubjectStats(db.Model):
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    subject_id = db.Column(db.Integer, db.ForeignKey('subject.id', ondelete='CASCADE'), primary_key=True)
+    attempt_count = db.Column(db.Integer, nullable=False, default=0)
+
+class UserMonthStats(db.Model):
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    month = db.Column(db.String(7), primary_key=True)  # 'YYYY-MM'
+    attempt_count = db.Column(db.Integer, nullable=False, default=0)
+
+
+# Single row, bumped by every catalogue change (see cache.py)
+class CatalogueVersion(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+
+# Background delete of a subject, chapter or quiz and everything under it (see deletes.py)
+class DeleteJob(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(10), nullable=False)  # 'subject', 'chapter' or 'quiz'
+    target_id = db.Column(db.Integer, nullable=False)
+    label = db.Column(db.String(200), nullable=False)
+    status = db.Column(db.String(10), nullable=False, default='queued')  # queued, running, done, failed
+    total_rows = db.Column(db.Integer, nullable=False, default=0)
+    deleted_rows = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text, nullable=True)
+    # process running it ('host:pid') and when it last made progress, a job whose
+    # heartbeat is older than DELETE_JOB_STALE_AFTER lost its process and can be restarted
+    owner = db.Column(db.String(80), nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    @property
+    def percent(self):
+        if self.status == 'done':
+            return 100
+        return min(99, self.deleted_rows * 100 // self.total_rows) if self.total_rows else 0
+
+
+# Adjust a counter column in the caller's transaction, e.g. bump_counter(Quiz.question_count, quiz_id)
+def bump_counter(column, id, delta=1):
+    model = column.class_
+    db.session.query(model).filter(model.id == id).update({column: column + delta}, synchronize_session=False)
+
+
+# Admin account created by "flask seed-admin" (username: admin, password: admin)
+def seed_admin():
     #if admin exists, else create admin
     admin = User.query.filter_by(is_admin=True).first()
     if not admin:
@@ -73,3 +171,4 @@ with app.app_context():
         admin = User(username='admin', passhash=password_hash, name='Admin', is_admin=True)
         db.session.add(admin)
         db.session.commit()
+    return admin
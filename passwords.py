@@ -0,0 +1,124 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from threading import BoundedSemaphore, Lock
+from time import perf_counter
+from flask import current_app
+from werkzeug.security import generate_password_hash, check_password_hash
+
+# Password hashing off the request threads. scrypt (werkzeug's default) burns CPU on
+# purpose, so hashes run on a pool of PASSWORD_HASH_WORKERS threads (hashlib lets go
+# of the GIL while it hashes, other requests keep being served) and the request thread
+# waits for its result. At most PASSWORD_HASH_QUEUE more hashes wait for a worker;
+# beyond that HasherBusy is raised and the user is asked to try again, so a burst of
+# logins can't tie up every request thread.
+#
+# New hashes use PASSWORD_HASH_METHOD. A stored hash made with other parameters is
+# replaced on its user's next successful login (see needs_rehash()).
+
+
+class HasherBusy(Exception):
+    pass
+
+
+class PasswordHasher:
+    def __init__(self, workers, queue_size, method):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.method = method
+        self.prefix = None  # method as werkzeug writes it in front of a hash, e.g. 'scrypt:32768:8:1'
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+        self.slots = BoundedSemaphore(workers + queue_size)
+        self.lock = Lock()
+        self.queued = 0
+        self.running = 0
+        self.max_queued = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_seconds = 0.0
+        self.hash_seconds = 0.0
+
+    def run(self, func, *args):
+        if not self.slots.acquire(blocking=False):
+            with self.lock:
+                self.rejected += 1
+            raise HasherBusy()
+        try:
+            with self.lock:
+                self.queued += 1
+                self.max_queued = max(self.max_queued, self.queued)
+            return self.executor.submit(self.timed, perf_counter(), func, *args).result()
+        finally:
+            self.slots.release()
+
+    def timed(self, submitted, func, *args):
+        started = perf_counter()
+        with self.lock:
+            self.queued -= 1
+            self.running += 1
+            self.wait_seconds += started - submitted
+        try:
+            return func(*args)
+        finally:
+            with self.lock:
+                self.running -= 1
+                self.completed += 1
+                self.hash_seconds += perf_counter() - started
+
+    def hash(self, password):
+        return self.run(generate_password_hash, password, self.method)
+
+    def check(self, passhash, password):
+        return self.run(check_password_hash, passhash, password)
+
+    # werkzeug fills in the defaults ('scrypt' -> 'scrypt:32768:8:1'), so the prefix
+    # to compare with is taken from a real hash, made once
+    def needs_rehash(self, passhash):
+        if self.prefix is None:
+            self.prefix = self.hash('').split('$', 1)[0]
+        return passhash.split('$', 1)[0] != self.prefix
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'workers': self.workers,
+                'queue_size': self.queue_size,
+                'queued': self.queued,
+                'running': self.running,
+                'max_queued': self.max_queued,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'wait_seconds': self.wait_seconds,
+                'hash_seconds': self.hash_seconds,
+            }
+
+    def prometheus_lines(self):
+        stats = self.snapshot()
+        lines = []
+        for name, kind, help, value in (
+            ('password_hash_queued', 'gauge', 'Password hashes waiting for a worker.', stats['queued']),
+            ('password_hash_running', 'gauge', 'Password hashes running.', stats['running']),
+            ('password_hash_total', 'counter', 'Password hashes and checks done.', stats['completed']),
+            ('password_hash_rejected_total', 'counter', 'Password hashes turned away with a full queue.',
+             stats['rejected']),
+            ('password_hash_wait_seconds_total', 'counter', 'Time password hashes waited for a worker.',
+             f"{stats['wait_seconds']:.6f}"),
+            ('password_hash_seconds_total', 'counter', 'Time spent hashing passwords.', f"{stats['hash_seconds']:.6f}"),
+        ):
+            lines.append(f'# HELP quizmaster_{name} {help}')
+            lines.append(f'# TYPE quizmaster_{name} {kind}')
+            lines.append(f'quizmaster_{name} {value}')
+        return lines
+
+
+_start_lock = Lock()
+
+# created on first use, so each (forked) worker process gets its own threads
+def get_password_hasher():
+    with _start_lock:
+        hasher = current_app.extensions.get('password_hasher')
+        if hasher is None:
+            hasher = PasswordHasher(current_app.config['PASSWORD_HASH_WORKERS'] or os.cpu_count() or 1,
+                                    current_app.config['PASSWORD_HASH_QUEUE'],
+                                    current_app.config['PASSWORD_HASH_METHOD'])
+            current_app.extensions['password_hasher'] = hasher
+    return hasher
@@ -0,0 +1,80 @@
+from sqlalchemy.sql import func
+from models import db, Score, Subject, Chapter, Quiz
+
+# Listing queries for the dashboards. Each one returns flat rows with the
+# chapter/subject names and child counts already joined in, so templates
+# never touch a lazy relationship while looping (one SELECT per page).
+# Counts come from the denormalized counter columns, child rows are never loaded.
+
+def quiz_query(*filters):
+    return (
+        db.session.query(
+            Quiz.id, Quiz.date_of_quiz, Quiz.time_duration, Quiz.remarks, Quiz.chapter_id,
+            Quiz.question_count, Quiz.attempt_count,
+            Chapter.name.label('chapter_name'),
+            Subject.id.label('subject_id'),
+            Subject.name.label('subject_name'),
+        )
+        .join(Chapter, Chapter.id == Quiz.chapter_id)
+        .join(Subject, Subject.id == Chapter.subject_id)
+        .filter(*filters)
+        .order_by(Quiz.id)
+    )
+
+# user dashboard: quizzes still open, optionally searched by subject or chapter name
+def upcoming_quiz_query(today, parameter=None, query=''):
+    filters = [Quiz.date_of_quiz >= today]
+    if query and parameter == 'sname':
+        filters.append(Subject.name.ilike(f'%{query}%'))
+    elif query and parameter == 'qname':
+        filters.append(Chapter.name.ilike(f'%{query}%'))
+    return quiz_query(*filters)
+
+def subject_query(*filters):
+    return (
+        db.session.query(Subject.id, Subject.name, Subject.description, Subject.chapter_count)
+        .filter(*filters)
+        .order_by(Subject.id)
+    )
+
+# questions of every quiz in the chapter added up
+def chapter_query(*filters):
+    return (
+        db.session.query(
+            Chapter.id, Chapter.name, Chapter.description, Chapter.subject_id,
+            func.coalesce(func.sum(Quiz.question_count), 0).label('question_count'),
+        )
+        .outerjoin(Quiz, Quiz.chapter_id == Chapter.id)
+        .filter(*filters)
+        .group_by(Chapter.id)
+        .order_by(Chapter.id)
+    )
+
+def chapter_rows(*filters):
+    return chapter_query(*filters).all()
+
+# attempt_number is numbered in the same statement with a window function
+# (nth attempt of that quiz by the user, by date then id); returns the query so the route can paginate it
+def user_score_query(user_id):
+    numbered = (
+        db.session.query(
+            Score.id, Score.quiz_id, Score.score, Score.date_attempted,
+            func.row_number().over(
+                partition_by=Score.quiz_id,
+                order_by=(Score.date_attempted, Score.id),
+            ).label('attempt_number'),
+        )
+        .filter(Score.user_id == user_id)
+        .subquery()
+    )
+    return (
+        db.session.query(
+            numbered.c.id, numbered.c.quiz_id, numbered.c.score, numbered.c.date_attempted,
+            numbered.c.attempt_number,
+            Chapter.name.label('chapter_name'),
+            Quiz.question_count,
+        )
+        .join(Quiz, Quiz.id == numbered.c.quiz_id)
+        .join(Chapter, Chapter.id == Quiz.chapter_id)
+        .order_by(numbered.c.id)
+    )
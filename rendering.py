@@ -0,0 +1,119 @@
+import gzip
+import os
+import zlib
+from flask import Response, current_app, get_flashed_messages, render_template, request, stream_template
+from jinja2 import FileSystemBytecodeCache
+
+# How pages get from the templates to the wire:
+# - compiled templates are kept on disk (JINJA_BYTECODE_CACHE), so a new worker loads
+#   them instead of compiling every template again;
+# - the long listing pages are streamed (stream_page), their first bytes go out while
+#   the rest of the table is still being rendered;
+# - text responses above COMPRESS_MIN_SIZE are sent brotli (when the brotli package is
+#   installed) or gzip compressed, streamed ones chunk by chunk.
+
+COMPRESSED_TYPES = ('text/html', 'text/plain', 'text/csv', 'application/json', 'application/x-ndjson')
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Streamed pages are sent in pieces of about STREAM_BUFFER_SIZE characters rather than
+# in the many small strings Jinja produces
+def buffered(chunks, size):
+    buffer, length = [], 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield ''.join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+def stream_page(template_name, **context):
+    if not current_app.config['STREAM_TEMPLATES']:
+        return render_template(template_name, **context)
+    # the session cookie is sent before the page is rendered, so the flash messages
+    # must be taken out of it now (the template then reads them from the request)
+    get_flashed_messages()
+    return Response(buffered(stream_template(template_name, **context), current_app.config['STREAM_BUFFER_SIZE']),
+                    mimetype='text/html')
+
+
+class GzipStream:
+    def __init__(self, level):
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def chunk(self, data):
+        return self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self.compressor.flush()
+
+class BrotliStream:
+    def __init__(self, quality):
+        self.compressor = brotli.Compressor(quality=quality)
+
+    def chunk(self, data):
+        return self.compressor.process(data) + self.compressor.flush()
+
+    def finish(self):
+        return self.compressor.finish()
+
+def compressed_chunks(chunks, stream):
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        if chunk:
+            yield stream.chunk(chunk)
+    yield stream.finish()
+
+def choose_encoding():
+    if brotli is not None and request.accept_encodings['br']:
+        return 'br'
+    if request.accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+def compress_response(response):
+    config = current_app.config
+    if (response.status_code != 200 or response.direct_passthrough or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSED_TYPES):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding()
+    if encoding is None:
+        return response
+    if not response.is_streamed and (response.content_length or 0) < config['COMPRESS_MIN_SIZE']:
+        return response
+    if response.is_streamed:
+        stream = BrotliStream(config['COMPRESS_BROTLI_QUALITY']) if encoding == 'br' else GzipStream(config['COMPRESS_GZIP_LEVEL'])
+        response.response = compressed_chunks(response.response, stream)
+        response.headers.pop('Content-Length', None)
+    elif encoding == 'br':
+        response.set_data(brotli.compress(response.get_data(), quality=config['COMPRESS_BROTLI_QUALITY']))
+    else:
+        response.set_data(gzip.compress(response.get_data(), compresslevel=config['COMPRESS_GZIP_LEVEL']))
+    response.headers['Content-Encoding'] = encoding
+    # the same page in another encoding is not byte for byte the same
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+# compiles every template once, e.g. in the gunicorn master before the workers are forked
+def warm_templates(app):
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+
+def init_rendering(app):
+    if app.config['JINJA_BYTECODE_CACHE']:
+        directory = app.config['JINJA_CACHE_DIR'] or os.path.join(app.instance_path, 'jinja_cache')
+        os.makedirs(directory, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
+    if app.config['COMPRESS']:
+        app.after_request(compress_response)
@@ -1,10 +1,24 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, json
+from flask import Blueprint, current_app, render_template, request, redirect, url_for, flash, session, json, g, Response, stream_with_context
 from datetime import datetime, timedelta
-from app import app
-from models import db, User, Score, Subject, Chapter, Quiz, Question
-from werkzeug.security import generate_password_hash, check_password_hash
+import io
+from models import db, User, Score, Subject, Chapter, Quiz, Question, DeleteJob, bump_counter
 from functools import wraps
-from sqlalchemy.sql import func
+from attempt_store import get_attempt_store
+from grading import grade, record_score, answer_key
+import queries
+import summaries
+from user_cache import get_user_info, invalidate_user, current_user
+from search import search_query
+import bulk_io
+import exports
+from keyset import keyset_paginate
+from passwords import get_password_hasher, HasherBusy
+from rendering import stream_page
+from deletes import start_delete_job, restart_job, is_stale
+from cache import (cached, cached_fragment, conditional, catalogue_version, new_version,
+                   invalidate_subject_page, invalidate_subject, invalidate_chapter, invalidate_quiz)
+
+bp = Blueprint('main', __name__)
 
 # decorator for auth_required
 def auth_required(func):
@@ -12,12 +26,13 @@ def auth_required(func):
     def inner(*args, **kwargs):
         if 'user_id' not in session:
             flash('Please, login to continue!')
-            return redirect(url_for('login'))
+            return redirect(url_for('main.login'))
             
-        user = User.query.get(session['user_id'])
+        user = get_user_info(session['user_id'])
         if user is None:  # Check if user is found
             # flash('User not found!')
-            return redirect(url_for('login'))
+            return redirect(url_for('main.login'))
+        g.user_info = user
         return func(*args, **kwargs)
     return inner
 
@@ -27,69 +42,91 @@ def admin_required(func):
     def inner(*args, **kwargs):
         if 'user_id' not in session:
             flash('Please, login to continue!')
-            return redirect(url_for('login'))
-        user = User.query.get(session['user_id'])
+            return redirect(url_for('main.login'))
+        user = get_user_info(session['user_id'])
         if user is None:  # Check if user is found
             # flash('User not found!')
-            return redirect(url_for('login'))
+            return redirect(url_for('main.login'))
         if not user.is_admin:
             flash('You are not authorized to view this page!')
-            return redirect(url_for('index'))
+            return redirect(url_for('main.index'))
+        g.user_info = user
         return func(*args, **kwargs)
     return inner
 
 
-@app.route('/')
+@bp.route('/')
 @auth_required
 def index():
-    user = User.query.get(session['user_id'])
-    if user.is_admin:
-        return redirect(url_for('admin'))
+    if g.user_info.is_admin:
+        return redirect(url_for('main.admin'))
     
     parameters = {'sname': 'subject', 'qname': 'quiz'}
     parameter = request.args.get('parameter')
     query = request.args.get('query','').strip()
-    subjects = Subject.query.all()
+    page = request.args.get('page', 1, type=int)
+    per_page = current_app.config['QUIZZES_PER_PAGE']
     now = datetime.now()
     #now= datetime(2025,4,2)
-    # Query quizzes that are still valid (future or today)
-    quizzes = Quiz.query.filter(Quiz.date_of_quiz >= now.date()).all()
-    return render_template('index.html', subjects=subjects, quizzes=quizzes, param=parameter, query=query, parameters=parameters)
+    # the whole query string, the page links in the fragment repeat it
+    key = ('upcoming_quizzes', catalogue_version(), now.date(), per_page, tuple(sorted(request.args.items(multi=True))))
+
+    # Query quizzes that are still valid (future or today), search and paging done in SQL
+    def quizzes_table():
+        quizzes = queries.upcoming_quiz_query(now.date(), parameter, query).paginate(
+            page=page, per_page=per_page, error_out=False)
+        return render_template('upcoming_quizzes.html', quizzes=quizzes, param=parameter, query=query)
+
+    return conditional(key, lambda: render_template(
+        'index.html', quizzes_table=cached_fragment(key, quizzes_table), param=parameter, query=query,
+        parameters=parameters))
 
 #------------------COMMON ROUTES FOR BOTH USER & ADMIN------------------
-@app.route('/login')
+@bp.route('/login')
 def login():
     return render_template('login.html')
 
-@app.route('/login', methods=['POST'])
+@bp.route('/login', methods=['POST'])
 def login_post():
     username = request.form.get('username')
     password = request.form.get('password')
 
     if not username or not password:
         flash('Please, fill out all fields!')
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
 
     user = User.query.filter_by(username=username).first()
     if not user:
         flash('Username does not exist!')
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
     
-    if not check_password_hash(user.passhash, password):
-        flash('Incorrect password!')
-        return redirect(url_for('login'))
+    hasher = get_password_hasher()
+    try:
+        if not hasher.check(user.passhash, password):
+            flash('Incorrect password!')
+            return redirect(url_for('main.login'))
+    except HasherBusy:
+        flash('Too many logins right now, please try again in a moment!')
+        return redirect(url_for('main.login'))
+    # hashed with older parameters, store it again with the current ones
+    try:
+        if hasher.needs_rehash(user.passhash):
+            user.passhash = hasher.hash(password)
+            db.session.commit()
+    except HasherBusy:
+        pass  # next login
     
     session['user_id'] = user.id
     session['is_admin'] = user.is_admin
     flash('Login successful!')
-    return redirect(url_for('index'))
+    return redirect(url_for('main.index'))
 
-@app.route('/register')
+@bp.route('/register')
 def register():
     return render_template('register.html')
 
 
-@app.route('/register', methods=['POST'])
+@bp.route('/register', methods=['POST'])
 def register_post():
     username = request.form.get('username')
     password = request.form.get('password')
@@ -106,7 +143,7 @@ def register_post():
     
     if dob > datetime.now().date():
         flash('Invalid date of birth!')
-        return redirect(url_for('register'))
+        return redirect(url_for('main.register'))
     
     qualification = request.form.get('qualification')
     if not qualification:
@@ -114,30 +151,34 @@ def register_post():
 
     if not username or not password or not confirm_password or not name:
         flash('Please, fill out all fields!')
-        return redirect(url_for('register'))
+        return redirect(url_for('main.register'))
     
     if password != confirm_password:
         flash('Passwords do not match!')
-        return redirect(url_for('register'))
+        return redirect(url_for('main.register'))
     
     user = User.query.filter_by(username=username).first()
     if user:
         flash('Username already exists!')
-        return redirect(url_for('register'))
+        return redirect(url_for('main.register'))
     
-    password_hash = generate_password_hash(password)
+    try:
+        password_hash = get_password_hasher().hash(password)
+    except HasherBusy:
+        flash('Too many requests right now, please try again in a moment!')
+        return redirect(url_for('main.register'))
     new_user = User(username=username, passhash=password_hash, name=name, dob=dob, qualification=qualification)
     db.session.add(new_user)
     db.session.commit()
-    return redirect(url_for('login'))
+    return redirect(url_for('main.login'))
 
-@app.route('/profile')
+@bp.route('/profile')
 @auth_required
 def profile():
-    user = User.query.get(session['user_id'])
+    user = current_user()
     return render_template('profile.html', user=user)
 
-@app.route('/profile', methods=['POST'])
+@bp.route('/profile', methods=['POST'])
 @auth_required
 def profile_post():
     username = request.form.get('username')
@@ -146,135 +187,148 @@ def profile_post():
     name = request.form.get('name')
     if not username or not cpassword or not password or not name:
         flash('Please, fill out all fields!')
-        return redirect(url_for('profile'))
-
-    user = User.query.get(session['user_id'])
-    if not check_password_hash(user.passhash, cpassword):
-        flash('Incorrect current password!')
-        return redirect(url_for('profile'))
-    if username != user.username:
-        new_username = User.query.filter_by(username=username).first()
-        if new_username:
-            flash('Username already exists!')
-            return redirect(url_for('profile'))
-    
-    new_password_hash = generate_password_hash(password)
+        return redirect(url_for('main.profile'))
+
+    user = current_user()
+    hasher = get_password_hasher()
+    try:
+        if not hasher.check(user.passhash, cpassword):
+            flash('Incorrect current password!')
+            return redirect(url_for('main.profile'))
+        if username != user.username:
+            new_username = User.query.filter_by(username=username).first()
+            if new_username:
+                flash('Username already exists!')
+                return redirect(url_for('main.profile'))
+        # the form always sends the password, only hash it when it changed
+        if password != cpassword or hasher.needs_rehash(user.passhash):
+            user.passhash = hasher.hash(password)
+    except HasherBusy:
+        flash('Too many requests right now, please try again in a moment!')
+        return redirect(url_for('main.profile'))
     user.username = username
-    user.passhash = new_password_hash
     user.name = name
     db.session.commit()
+    invalidate_user(user.id)
     flash('Profile updated successfully!')
-    return redirect(url_for('profile'))
+    return redirect(url_for('main.profile'))
 
 
-@app.route('/logout')
+@bp.route('/logout')
 @auth_required
 def logout():
     session.pop('user_id')
-    return redirect(url_for('login'))
+    return redirect(url_for('main.login'))
 
 # ----------ROUTES FOR ADMIN----------------
 
-@app.route('/admin')
+# One page of an admin list, from the ?after=/?before= cursors of the previous page
+def admin_page(query, *columns):
+    return keyset_paginate(query, list(columns), request.args.get('after'), request.args.get('before'),
+                           current_app.config['ADMIN_PER_PAGE'])
+
+@bp.route('/admin')
 @admin_required
 def admin():
-    subjects = Subject.query.all()
+    subjects = admin_page(queries.subject_query(), Subject.id)
     return render_template('admin.html', subjects=subjects)
 
 # Routes for subjects to be added by admin
-@app.route('/subject/add')
+@bp.route('/subject/add')
 @admin_required
 def add_subject():
     return render_template('subject/add.html')
 
-@app.route('/subject/add', methods=['POST'])
+@bp.route('/subject/add', methods=['POST'])
 @admin_required
 def add_subject_post():
     name = request.form.get('name')
     description = request.form.get('description')
     if not name:
         flash('Please, fill out all fields!')
-        return redirect(url_for('add_subject'))
+        return redirect(url_for('main.add_subject'))
     
-    subject = Subject(name=name, description=description)
+    subject = Subject(name=name, description=description, version=new_version())
     db.session.add(subject)
     db.session.commit()
     flash('Subject added successfully!')
-    return redirect(url_for('admin'))
+    return redirect(url_for('main.admin'))
 
-@app.route('/subject/<int:id>/')
+@bp.route('/subject/<int:id>/')
 @admin_required
 def view_subject(id):
     subject = Subject.query.get(id)
     if not subject:
         flash('Subject does not exist!')
-        return redirect(url_for('admin'))
-    return render_template('subject/view.html', subject=subject)
+        return redirect(url_for('main.admin'))
+    key = ('subject_chapters', subject.id, subject.version)
+    chapters = cached_fragment(key, lambda: render_template(
+        'subject/chapters.html', chapters=queries.chapter_rows(Chapter.subject_id == subject.id)))
+    return conditional(key, lambda: render_template('subject/view.html', subject=subject, chapters=chapters))
 
-@app.route('/subject/<int:id>/edit')
+@bp.route('/subject/<int:id>/edit')
 @admin_required
 def edit_subject(id):
     subject = Subject.query.get(id)
     if not subject:
         flash('Subject does not exist!')
-        return redirect(url_for('admin'))
+        return redirect(url_for('main.admin'))
     return render_template('subject/edit.html', subject=subject)
 
-@app.route('/subject/<int:id>/edit', methods=['POST'])
+@bp.route('/subject/<int:id>/edit', methods=['POST'])
 @admin_required
 def edit_subject_post(id):
     subject = Subject.query.get(id)
     if not subject:
         flash('Subject does not exist!')
-        return redirect(url_for('admin'))
+        return redirect(url_for('main.admin'))
     name = request.form.get('name')
     description = request.form.get('description')
     if not name:
         flash('Please, fill out all fields!')
-        return redirect(url_for('edit_subject', id=id))
+        return redirect(url_for('main.edit_subject', id=id))
     
+    invalidate_subject(subject.id)
     subject.name = name
     subject.description = description
     db.session.commit()
     flash('Subject updated successfully!')
-    return redirect(url_for('admin'))
+    return redirect(url_for('main.admin'))
 
 
-@app.route('/subject/<int:id>/delete')
+@bp.route('/subject/<int:id>/delete')
 @admin_required
 def delete_subject(id):
     subject = Subject.query.get(id)
     if not subject:
         flash('Subject does not exist!')
-        return redirect(url_for('admin'))
+        return redirect(url_for('main.admin'))
     return render_template('subject/delete.html', subject=subject)
 
-@app.route('/subject/<int:id>/delete', methods=['POST'])
+@bp.route('/subject/<int:id>/delete', methods=['POST'])
 @admin_required
 def delete_subject_post(id):
     subject = Subject.query.get(id)
     if not subject:
         flash('Subject does not exist!')
-        return redirect(url_for('admin'))
-    db.session.delete(subject)
-    db.session.commit()
-    flash('Subject deleted successfully!')
-    return redirect(url_for('admin'))
+        return redirect(url_for('main.admin'))
+    job = start_delete_job('subject', subject.id, f'subject {subject.name}')
+    return redirect(url_for('main.delete_job', id=job.id))
 
 
 # Routes for chapters to be added by admin
 
-@app.route('/chapter/add/<int:subject_id>')
+@bp.route('/chapter/add/<int:subject_id>')
 @admin_required
 def add_chapter(subject_id):
     subjects = Subject.query.all()
     subject = Subject.query.get(subject_id)
     if not subject:
         flash('Subject does not exist!')
-        return redirect(url_for('admin'))
+        return redirect(url_for('main.admin'))
     return render_template('chapter/add.html', subject=subject, subjects=subjects)
 
-@app.route('/chapter/add/', methods=['POST'])
+@bp.route('/chapter/add/', methods=['POST'])
 @admin_required
 def add_chapter_post():
     name = request.form.get('name')
@@ -284,25 +338,27 @@ def add_chapter_post():
     subject = Subject.query.get(subject_id)
     if not subject:
         flash('Subject does not exist!')
-        return redirect(url_for('admin'))
+        return redirect(url_for('main.admin'))
     if not name:
         flash('Please, fill out all fields!')
-        return redirect(url_for('add_chapter', subject_id=subject_id))
+        return redirect(url_for('main.add_chapter', subject_id=subject_id))
     
     chapter = Chapter(name=name, description=description, subject_id=subject_id)
     db.session.add(chapter)
+    bump_counter(Subject.chapter_count, subject.id)
+    invalidate_subject_page(subject.id)
     db.session.commit()
     flash('Chapter added successfully!')
-    return redirect(url_for('view_subject', id=subject_id))
+    return redirect(url_for('main.view_subject', id=subject_id))
 
-@app.route('/chapter/<int:id>/edit')
+@bp.route('/chapter/<int:id>/edit')
 @admin_required
 def edit_chapter(id):
     subjects = Subject.query.all()
     chapter = Chapter.query.get(id)
     return render_template('chapter/edit.html', chapter=chapter, subjects=subjects)
 
-@app.route('/chapter/<int:id>/edit', methods=['POST'])
+@bp.route('/chapter/<int:id>/edit', methods=['POST'])
 @admin_required
 def edit_chapter_post(id):
     name = request.form.get('name')
@@ -312,68 +368,195 @@ def edit_chapter_post(id):
     chapter = Chapter.query.get(id)
     if not chapter:
         flash('Chapter does not exist!')
-        return redirect(url_for('admin'))
+        return redirect(url_for('main.admin'))
     if not name:
         flash('Please, fill out all fields!')
-        return redirect(url_for('edit_chapter', id=id))
+        return redirect(url_for('main.edit_chapter', id=id))
     
+    invalidate_chapter(chapter.id)
+    if int(subject_id) != chapter.subject_id:
+        bump_counter(Subject.chapter_count, chapter.subject_id, -1)
+        bump_counter(Subject.chapter_count, int(subject_id))
+        invalidate_subject_page(int(subject_id))
+    old_subject_id = chapter.subject_id
     chapter.name = name
     chapter.description = description
     chapter.subject_id = subject_id
+    if int(subject_id) != old_subject_id:
+        db.session.flush()
+        summaries.rebuild_subjects([old_subject_id, int(subject_id)])  # its scores moved along
     db.session.commit()
     flash('Chapter updated successfully!')
-    return redirect(url_for('view_subject', id=subject_id))
+    return redirect(url_for('main.view_subject', id=subject_id))
 
-@app.route('/chapter/<int:id>/delete')
+@bp.route('/chapter/<int:id>/delete')
 @admin_required
 def delete_chapter(id):
     chapter = Chapter.query.get(id)
     if not chapter:
         flash('Chapter does not exist!')
-        return redirect(url_for('admin'))
+        return redirect(url_for('main.admin'))
     return render_template('chapter/delete.html', chapter=chapter)
 
-@app.route('/chapter/<int:id>/delete', methods=['POST'])
+@bp.route('/chapter/<int:id>/delete', methods=['POST'])
 @admin_required
 def delete_chapter_post(id):
     chapter = Chapter.query.get(id)
     if not chapter:
         flash('Chapter does not exist!')
-    db.session.delete(chapter)
-    db.session.commit()
-    flash('Chapter deleted successfully!')
-    return redirect(url_for('view_subject', id=chapter.subject_id))
+        return redirect(url_for('main.admin'))
+    job = start_delete_job('chapter', chapter.id, f'chapter {chapter.name}')
+    return redirect(url_for('main.delete_job', id=job.id))
 
 #----Route for Admin to view User Details----
-@app.route('/admin/users')
+@bp.route('/admin/users')
 @admin_required
 def admin_view_users():
-    users = User.query.all()
-    return render_template('admin/users.html', users=users)
+    users = admin_page(User.query, User.id)
+    return stream_page('admin/users.html', users=users)
+
+#----Typeahead lookups for the chapter/quiz dropdowns, a small JSON slice per keystroke----
+def lookup_response(query, column, label):
+    page = keyset_paginate(query, [column], request.args.get('after'), per_page=current_app.config['LOOKUP_LIMIT'])
+    return {'results': [{'id': row.id, 'label': label(row)} for row in page],
+            'next': page.next_cursor if page.has_next else None}
+
+@bp.route('/admin/lookup/chapters')
+@admin_required
+def lookup_chapters():
+    search = request.args.get('q', '').strip()
+    query = db.session.query(Chapter.id, Chapter.name)
+    if search:
+        query = query.filter(Chapter.name.ilike(f'%{search}%'))
+    return lookup_response(query, Chapter.id, lambda row: row.name)
+
+# by quiz id or by chapter name
+@bp.route('/admin/lookup/quizzes')
+@admin_required
+def lookup_quizzes():
+    search = request.args.get('q', '').strip()
+    query = db.session.query(Quiz.id, Chapter.name.label('chapter_name')).join(Chapter, Chapter.id == Quiz.chapter_id)
+    if search.isdigit():
+        query = query.filter((Quiz.id == int(search)) | Chapter.name.ilike(f'%{search}%'))
+    elif search:
+        query = query.filter(Chapter.name.ilike(f'%{search}%'))
+    return lookup_response(query, Quiz.id, lambda row: f'Quiz {row.id} ({row.chapter_name})')
+
+#----Bulk import/export of subjects, chapters, quizzes and questions (see bulk_io.py)----
+@bp.route('/admin/import')
+@admin_required
+def admin_import():
+    return render_template('admin/import.html', kinds=bulk_io.FIELDS)
+
+@bp.route('/admin/import', methods=['POST'])
+@admin_required
+def admin_import_post():
+    kind = request.form.get('kind')
+    file = request.files.get('file')
+    if kind not in bulk_io.FIELDS or not file or not file.filename:
+        flash('Please, choose what to import and a file!')
+        return redirect(url_for('main.admin_import'))
+
+    fmt = bulk_io.format_from_filename(file.filename)
+    stream = io.TextIOWrapper(file.stream, encoding='utf-8-sig', newline='')
+    try:
+        imported, errors = bulk_io.import_rows(kind, stream, fmt, current_app.config['IMPORT_BATCH_SIZE'])
+    except UnicodeDecodeError:
+        db.session.rollback()
+        flash('The file is not UTF-8 encoded, rows before the bad one may have been imported!')
+        return redirect(url_for('main.admin_import'))
+    flash(f'Imported {imported} rows, skipped {len(errors)} rows.')
+    return render_template('admin/import.html', kinds=bulk_io.FIELDS, kind=kind,
+                           errors=errors[:current_app.config['IMPORT_ERRORS_SHOWN']], error_count=len(errors))
+
+@bp.route('/admin/export/<kind>')
+@admin_required
+def admin_export(kind):
+    fmt = request.args.get('format', 'csv')
+    if kind not in bulk_io.FIELDS or fmt not in bulk_io.FORMATS:
+        flash('Nothing to export!')
+        return redirect(url_for('main.admin_import'))
+    rows = bulk_io.export_rows(kind, fmt, current_app.config['EXPORT_CHUNK_SIZE'])
+    return export_response(rows, kind, fmt)
+
+# rows is a generator of text chunks, written to the client as they are produced
+def export_response(rows, name, fmt):
+    return Response(stream_with_context(rows), mimetype=bulk_io.FORMATS[fmt],
+                    headers={'Content-Disposition': f'attachment; filename={name}.{fmt}'})
+
+#----Streamed exports of users and results, filtered by ?from=&to=&quiz_id=&subject_id= (see exports.py)----
+@bp.route('/admin/export/users')
+@admin_required
+def admin_export_users():
+    fmt = request.args.get('format', 'csv')
+    if fmt not in bulk_io.FORMATS:
+        flash('Nothing to export!')
+        return redirect(url_for('main.admin_view_users'))
+    return export_response(exports.users_export(fmt, current_app.config['EXPORT_CHUNK_SIZE']), 'users', fmt)
+
+@bp.route('/admin/export/scores')
+@admin_required
+def admin_export_scores():
+    fmt = request.args.get('format', 'csv')
+    try:
+        filters = exports.parse_filters(request.args)
+    except ValueError as e:
+        flash(f'Invalid filter: {e}')
+        return redirect(url_for('main.admin_view_users'))
+    if fmt not in bulk_io.FORMATS:
+        flash('Nothing to export!')
+        return redirect(url_for('main.admin_view_users'))
+    rows = exports.scores_export(fmt, filters, current_app.config['EXPORT_CHUNK_SIZE'])
+    return export_response(rows, 'scores', fmt)
+
+@bp.route('/admin/export/quiz/<int:id>/results')
+@admin_required
+def admin_export_quiz_results(id):
+    fmt = request.args.get('format', 'csv')
+    try:
+        filters = exports.parse_filters(request.args)
+    except ValueError as e:
+        flash(f'Invalid filter: {e}')
+        return redirect(url_for('main.view_quiz', id=id))
+    if fmt not in bulk_io.FORMATS or not db.session.get(Quiz, id):
+        flash('Nothing to export!')
+        return redirect(url_for('main.quiz'))
+    rows = exports.quiz_results_export(id, fmt, filters, current_app.config['EXPORT_CHUNK_SIZE'])
+    return export_response(rows, f'quiz-{id}-results', fmt)
+
+#----Request/SQL metrics of this process, when METRICS is on (see metrics.py)----
+@bp.route('/admin/metrics')
+@admin_required
+def admin_metrics():
+    metrics = current_app.extensions.get('metrics')
+    if metrics is None:
+        flash('Metrics are off, start the app with METRICS=true to collect them.')
+        return redirect(url_for('main.admin'))
+    endpoints, slowest = metrics.snapshot()
+    return render_template('admin/metrics.html', endpoints=endpoints, slowest=slowest,
+                           threshold=metrics.threshold, hashing=get_password_hasher().snapshot())
+
+@bp.route('/metrics')
+def prometheus_metrics():
+    metrics = current_app.extensions.get('metrics')
+    token = current_app.config['METRICS_TOKEN']
+    if metrics is None:
+        return 'Metrics are off\n', 404, {'Content-Type': 'text/plain'}
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return 'Unauthorized\n', 401, {'Content-Type': 'text/plain'}
+    if not token:  # no token configured: admins only, hidden from everyone else
+        user = get_user_info(session['user_id']) if 'user_id' in session else None
+        if user is None or not user.is_admin:
+            return 'Not Found\n', 404, {'Content-Type': 'text/plain'}
+    return metrics.prometheus_text(), 200, {'Content-Type': 'text/plain; version=0.0.4'}
 
 # Route for Admin to view Summary---
-@app.route('/admin/summary')
+@bp.route('/admin/summary')
 @admin_required
 def admin_summary():
-    # Fetch subject-wise user attempts
-    subject_attempts = (
-        db.session.query(Subject.name, func.count(Score.id).label('attempt_count'))
-        .join(Chapter, Chapter.subject_id == Subject.id)
-        .join(Quiz, Quiz.chapter_id == Chapter.id)
-        .join(Score, Score.quiz_id == Quiz.id)
-        .group_by(Subject.name)
-        .all()
-    )
-
-    # Fetch subject-wise top scores
-    subject_top_scores = (
-        db.session.query(Subject.name, func.max(Score.score).label('top_score'))
-        .join(Chapter, Chapter.subject_id == Subject.id)
-        .join(Quiz, Quiz.chapter_id == Chapter.id)
-        .join(Score, Score.quiz_id == Quiz.id)
-        .group_by(Subject.name)
-        .all()
-    )
+    # Subject-wise user attempts and top scores, read from the SubjectStats rollup
+    subject_attempts = summaries.subject_attempts()
+    subject_top_scores = summaries.subject_top_scores()
 
     return render_template(
         'admin/summary.html',
@@ -382,7 +565,7 @@ def admin_summary():
     )
 
 #----Route for Admin to Search---------
-@app.route('/admin/search')
+@bp.route('/admin/search')
 @admin_required
 def admin_search():
     # Get search parameters
@@ -395,45 +578,28 @@ def admin_search():
                   'qname': 'quiz',
                   'question': 'Question', 'chapter': 'Chapter'}
 
-    # Perform search based on the selected parameter
-    if parameter == 'user':  # Search for users
-        results = User.query.filter(
-            User.name.ilike(f"%{query}%") | User.username.ilike(f"%{query}%")
-        ).all()
-    elif parameter == 'sname':  # Search for subjects
-        results = Subject.query.filter(
-            Subject.name.ilike(f"%{query}%")
-        ).all()
-    elif parameter == 'qname':  # Search for quizzes
-        results = Quiz.query.join(Chapter).filter(
-            Chapter.name.ilike(f"%{query}%")
-        ).all()
-    elif parameter == 'question':  # Search for questions
-        results = Question.query.filter(
-            Question.question_statement.ilike(f"%{query}%")
-        ).all()
-    elif parameter == 'chapter':  # Search for chapters
-        results = Chapter.query.filter(
-            Chapter.name.ilike(f"%{query}%")
-        ).all()
-
-    return render_template('admin/admin_search.html', results=results, param=parameter, query=query, parameters=parameters)
+    # Ranked full text search, one page of results at a time
+    search = search_query(parameter, query)
+    if search is not None:
+        page = request.args.get('page', 1, type=int)
+        results = search.paginate(page=page, per_page=current_app.config['SEARCH_PER_PAGE'], error_out=False)
+
+    return stream_page('admin/admin_search.html', results=results, param=parameter, query=query, parameters=parameters)
 
 # Routes for QUIZ MANAGEMENT Dashboard--------------
-@app.route('/quiz')
+@bp.route('/quiz')
 @admin_required
 def quiz():
-    quizzes = Quiz.query.all()
-    return render_template('quiz.html', quizzes=quizzes)
+    quizzes = admin_page(queries.quiz_query(), Quiz.id)
+    return stream_page('quiz.html', quizzes=quizzes)
 
 # Routes for quizzes to be added by admin
-@app.route('/quiz/add')
+@bp.route('/quiz/add')
 @admin_required
 def add_quiz():
-    chapters = Chapter.query.all()
-    return render_template('quiz/add.html', chapters=chapters)
+    return render_template('quiz/add.html')
 
-@app.route('/quiz/add', methods=['POST'])
+@bp.route('/quiz/add', methods=['POST'])
 @admin_required
 def add_quiz_post():
     remarks = request.form.get('remarks')
@@ -444,10 +610,10 @@ def add_quiz_post():
     chapter = Chapter.query.get(chapter_id)
     if not chapter:
         flash('Chapter does not exist!')
-        return redirect(url_for('quiz'))
+        return redirect(url_for('main.quiz'))
     if not date_of_quiz or not time_duration:
         flash('Please, fill out all fields!')
-        return redirect(url_for('add_quiz',chapter_id=chapter_id)) 
+        return redirect(url_for('main.add_quiz',chapter_id=chapter_id)) 
     
     date_of_quiz = datetime.strptime(date_of_quiz, "%Y-%m-%d").date()
     # Split into hours and minutes and convert to total minutes
@@ -458,41 +624,46 @@ def add_quiz_post():
     
     if date_of_quiz < datetime.now().date():
         flash('Invalid date for quiz!')
-        return redirect(url_for('add_quiz'))
+        return redirect(url_for('main.add_quiz'))
 
-    quiz = Quiz(remarks=remarks, date_of_quiz=date_of_quiz, time_duration=duration, chapter_id=chapter_id)
+    quiz = Quiz(remarks=remarks, date_of_quiz=date_of_quiz, time_duration=duration, chapter_id=chapter_id,
+                version=new_version())
     db.session.add(quiz)
+    invalidate_subject_page(chapter.subject_id)
     db.session.commit()
     flash('Quiz added successfully!')
-    return redirect(url_for('quiz'))
+    return redirect(url_for('main.quiz'))
 
 
-@app.route('/quiz/<int:id>/')
+@bp.route('/quiz/<int:id>/')
 @admin_required
 def view_quiz(id):
-    quiz = Quiz.query.get(id)
+    quiz = (db.session.query(Quiz.id, Quiz.version, Chapter.name.label('chapter_name'))
+            .join(Chapter, Chapter.id == Quiz.chapter_id).filter(Quiz.id == id).first())
     if not quiz:
         flash('Quiz does not exist!')
-        return redirect(url_for('admin'))
-    return render_template('quiz/view.html', quiz=quiz)
+        return redirect(url_for('main.admin'))
+    key = ('quiz_questions', quiz.id, quiz.version)
+    questions = cached_fragment(key, lambda: render_template(
+        'quiz/questions.html', questions=Question.query.filter(Question.quiz_id == id).order_by(Question.id).all()))
+    return conditional(key, lambda: render_template('quiz/view.html', quiz=quiz, questions=questions))
 
-@app.route('/quiz/<int:id>/edit')
+@bp.route('/quiz/<int:id>/edit')
 @admin_required
 def edit_quiz(id):
-    chapters = Chapter.query.all()
     quiz = Quiz.query.get(id)
     if not quiz:
         flash('Quiz does not exist!')
-        return redirect(url_for('quiz'))
-    return render_template('quiz/edit.html', quiz=quiz, chapters=chapters)
+        return redirect(url_for('main.quiz'))
+    return render_template('quiz/edit.html', quiz=quiz)
 
-@app.route('/quiz/<int:id>/edit', methods=['POST'])
+@bp.route('/quiz/<int:id>/edit', methods=['POST'])
 @admin_required
 def edit_quiz_post(id):
     quiz = Quiz.query.get(id)
     if not quiz:
         flash('Quiz does not exist!')
-        return redirect(url_for('quiz'))
+        return redirect(url_for('main.quiz'))
     remarks = request.form.get('remarks')
     date_of_quiz = request.form.get('date_of_quiz')
     time_duration = request.form.get('time_duration')
@@ -500,7 +671,7 @@ def edit_quiz_post(id):
 
     if not date_of_quiz or not time_duration:
         flash('Please, fill out all fields!')
-        return redirect(url_for('edit_quiz', id=id))
+        return redirect(url_for('main.edit_quiz', id=id))
     
     date_of_quiz = datetime.strptime(date_of_quiz, "%Y-%m-%d").date()
     # Split into hours and minutes and convert to total minutes
@@ -511,50 +682,80 @@ def edit_quiz_post(id):
     
     if date_of_quiz < datetime.now().date():
         flash('Invalid date for quiz!')
-        return redirect(url_for('edit_quiz', id=id))
+        return redirect(url_for('main.edit_quiz', id=id))
     
+    invalidate_quiz(quiz.id)
+    moved_subjects = None
+    if int(chapter_id) != quiz.chapter_id:
+        new_subject_id = db.session.query(Chapter.subject_id).filter(Chapter.id == int(chapter_id)).scalar()
+        invalidate_subject_page(new_subject_id)
+        if new_subject_id != quiz.chapter.subject_id:
+            moved_subjects = [quiz.chapter.subject_id, new_subject_id]
     quiz.remarks = remarks
     quiz.date_of_quiz = date_of_quiz
     quiz.time_duration = duration
     quiz.chapter_id = chapter_id
+    if moved_subjects:
+        db.session.flush()
+        summaries.rebuild_subjects(moved_subjects)  # its scores moved along
     db.session.commit()
     flash('Quiz updated successfully!')
-    return redirect(url_for('quiz'))
+    return redirect(url_for('main.quiz'))
 
 
-@app.route('/quiz/<int:id>/delete')
+@bp.route('/quiz/<int:id>/delete')
 @admin_required
 def delete_quiz(id):
     quiz = Quiz.query.get(id)
     if not quiz:
         flash('Quiz does not exist!')
-        return redirect(url_for('quiz'))
+        return redirect(url_for('main.quiz'))
     return render_template('quiz/delete.html', quiz=quiz)
 
-@app.route('/quiz/<int:id>/delete', methods=['POST'])
+@bp.route('/quiz/<int:id>/delete', methods=['POST'])
 @admin_required
 def delete_quiz_post(id):
     quiz = Quiz.query.get(id)
     if not quiz:
         flash('Quiz does not exist!')
-        return redirect(url_for('quiz'))
-    db.session.delete(quiz)
-    db.session.commit()
-    flash('Quiz deleted successfully!')
-    return redirect(url_for('quiz'))
+        return redirect(url_for('main.quiz'))
+    job = start_delete_job('quiz', quiz.id, f'quiz {quiz.id} ({quiz.chapter.name})')
+    return redirect(url_for('main.delete_job', id=job.id))
+
+# progress of a background delete, the page refreshes itself until it is done
+@bp.route('/admin/jobs/<int:id>')
+@admin_required
+def delete_job(id):
+    job = DeleteJob.query.get(id)
+    if not job:
+        flash('Job does not exist!')
+        return redirect(url_for('main.admin'))
+    back = url_for('main.quiz') if job.kind == 'quiz' else url_for('main.admin')
+    return render_template('admin/delete_job.html', job=job, back=back, stale=is_stale(job))
+
+# starts a delete again that failed or whose process stopped
+@bp.route('/admin/jobs/<int:id>', methods=['POST'])
+@admin_required
+def delete_job_restart(id):
+    job = DeleteJob.query.get(id)
+    if not job:
+        flash('Job does not exist!')
+        return redirect(url_for('main.admin'))
+    if not restart_job(job):
+        flash('The delete is still running.')
+    return redirect(url_for('main.delete_job', id=job.id))
 
 # Routes for Questions to be added to the Quizzes------------------
-@app.route('/question/add/<int:quiz_id>')
+@bp.route('/question/add/<int:quiz_id>')
 @admin_required
 def add_question(quiz_id):
-    quizzes = Quiz.query.all()
     quiz = Quiz.query.get(quiz_id)
     if not quiz:
         flash('Quiz does not exist!')
-        return redirect(url_for('quiz'))
-    return render_template('question/add.html', quiz=quiz, quizzes=quizzes)
+        return redirect(url_for('main.quiz'))
+    return render_template('question/add.html', quiz=quiz)
 
-@app.route('/quiz/add/', methods=['POST'])
+@bp.route('/quiz/add/', methods=['POST'])
 @admin_required
 def add_question_post():
     question_title = request.form.get('question_title')
@@ -569,25 +770,29 @@ def add_question_post():
     quiz = Quiz.query.get(quiz_id)
     if not quiz:
         flash('Quiz does not exist!')
-        return redirect(url_for('quiz'))
+        return redirect(url_for('main.quiz'))
     if not question_title or not question_statement or not option1 or not option2 or not option3 or not option4 or not correct_option:
         flash('Please, fill out all fields!')
-        return redirect(url_for('add_question', quiz_id=quiz_id))
+        return redirect(url_for('main.add_question', quiz_id=quiz_id))
     
     question = Question(question_title=question_title, question_statement=question_statement, option1=option1, option2=option2, option3=option3, option4=option4, correct_option=correct_option, quiz_id=quiz_id)
     db.session.add(question)
+    bump_counter(Quiz.question_count, quiz.id)
+    invalidate_quiz(quiz.id)
     db.session.commit()
     flash('Question added successfully!')
-    return redirect(url_for('view_quiz', id=quiz_id))
+    return redirect(url_for('main.view_quiz', id=quiz_id))
 
-@app.route('/question/<int:id>/edit')
+@bp.route('/question/<int:id>/edit')
 @admin_required
 def edit_question(id):
-    quizzes = Quiz.query.all()
     question = Question.query.get(id)
-    return render_template('question/edit.html', question=question, quizzes=quizzes)
+    if not question:
+        flash('Question does not exist!')
+        return redirect(url_for('main.quiz'))
+    return render_template('question/edit.html', question=question)
 
-@app.route('/question/<int:id>/edit', methods=['POST'])
+@bp.route('/question/<int:id>/edit', methods=['POST'])
 @admin_required
 def edit_question_post(id):
     question_title = request.form.get('question_title')
@@ -602,10 +807,10 @@ def edit_question_post(id):
     question = Question.query.get(id)
     if not question:
         flash('Question does not exist!')
-        return redirect(url_for('quiz'))
+        return redirect(url_for('main.quiz'))
     if not question_title or not question_statement or not option1 or not option2 or not option3 or not option4 or not correct_option:
         flash('Please, fill out all fields!')
-        return redirect(url_for('edit_question', id=id))
+        return redirect(url_for('main.edit_question', id=id))
     
     question.question_title = question_title
     question.question_statement = question_statement
@@ -614,170 +819,165 @@ def edit_question_post(id):
     question.option3 = option3
     question.option4 = option4
     question.correct_option = correct_option
+    if int(quiz_id) != question.quiz_id:
+        bump_counter(Quiz.question_count, question.quiz_id, -1)
+        bump_counter(Quiz.question_count, int(quiz_id))
+        invalidate_quiz(int(quiz_id))
+    invalidate_quiz(question.quiz_id)
     question.quiz_id = quiz_id
     db.session.commit()
     flash('Question updated successfully!')
-    return redirect(url_for('view_quiz', id=quiz_id))
+    return redirect(url_for('main.view_quiz', id=quiz_id))
 
-@app.route('/question/<int:id>/delete')
+@bp.route('/question/<int:id>/delete')
 @admin_required
 def delete_question(id):
     question = Question.query.get(id)
     if not question:
         flash('Question does not exist!')
-        return redirect(url_for('Quiz'))
+        return redirect(url_for('main.quiz'))
     return render_template('question/delete.html', question=question)
 
-@app.route('/question/<int:id>/delete', methods=['POST'])
+@bp.route('/question/<int:id>/delete', methods=['POST'])
 @admin_required
 def delete_question_post(id):
     question = Question.query.get(id)
     if not question:
         flash('Question does not exist!')
+    bump_counter(Quiz.question_count, question.quiz_id, -1)
+    invalidate_quiz(question.quiz_id)
     db.session.delete(question)
     db.session.commit()
     flash('Question deleted successfully!')
-    return redirect(url_for('view_quiz', id=question.quiz_id))
+    return redirect(url_for('main.view_quiz', id=question.quiz_id))
 
 
 #-------USER ROUTES---------
-@app.route('/user_view_quiz/<int:id>/')
+@bp.route('/user_view_quiz/<int:id>/')
 @auth_required
 def user_view_quiz(id):
-    quiz = Quiz.query.get(id)
-    if not quiz:
+    version = db.session.query(Quiz.version).filter(Quiz.id == id).scalar()
+    if version is None:
         flash('Quiz does not exist!')
-        return redirect(url_for('index'))
-    questions = quiz.questions
-    return render_template('user/view_quiz.html', quiz=quiz)
+        return redirect(url_for('main.index'))
+    key = ('quiz_details', id, version)
+    quiz = cached(key, lambda: queries.quiz_query(Quiz.id == id).first()._asdict())
+    return conditional(key, lambda: render_template('user/view_quiz.html', quiz=quiz))
 
-@app.route('/user_view_quiz/close')
+@bp.route('/user_view_quiz/close')
 @auth_required
 def user_close_quiz_details():
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
 
 #Route to Start Quiz---
-@app.route('/start_quiz/<int:id>', methods=['GET', 'POST'])
+# Answers are kept in the attempt store, the session only holds the attempt id
+def current_attempt(store, quiz):
+    attempt = store.get(session.get('attempt_id'))
+    if attempt and attempt['user_id'] == session['user_id'] and attempt['quiz_id'] == quiz.id:
+        return attempt
+    return None
+
+@bp.route('/start_quiz/<int:id>', methods=['GET', 'POST'])
 @auth_required
 def start_quiz(id):
     quiz = Quiz.query.get(id)
     if not quiz:
         flash('Quiz does not exist!')
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     questions = quiz.questions
     current_question = int(request.args.get('current_question', 0))
-    if 'remaining_time' not in session:
-        session['remaining_time'] = quiz.time_duration.total_seconds()
+    store = get_attempt_store()
+    attempt = current_attempt(store, quiz)
+    if not attempt:
+        attempt_id = store.start(session['user_id'], quiz.id, int(quiz.time_duration.total_seconds()))
+        session['attempt_id'] = attempt_id
+        attempt = store.get(attempt_id)
 
     if request.method == 'POST':
         selected_answer = request.form.get('ans')
         if not selected_answer:
             selected_answer = ""
-        # Store the selected answer in the session
-        if 'answers' not in session:
-            session['answers'] = {}
-        answers = session['answers']  
-        answers[str(questions[current_question].id)] = selected_answer
-        session['answers'] = answers 
-
-        session['remaining_time'] = int(request.form.get('remaining_time', session['remaining_time']))
+        remaining_time = int(request.form.get('remaining_time', attempt['remaining_time']))
+        # One small write per question instead of re-signing every answer into the cookie
+        store.save_answer(attempt['id'], questions[current_question].id, selected_answer, remaining_time)
   
-        return redirect(url_for('start_quiz', id=id, current_question=current_question + 1))
+        return redirect(url_for('main.start_quiz', id=id, current_question=current_question + 1))
         
     return render_template('user/start_quiz.html',
                            quiz=quiz, questions=questions,
                            current_question=current_question,
-                           remaining_time=session['remaining_time'])
+                           remaining_time=attempt['remaining_time'])
+
+# Single page mode, questions come from /api/quiz/<id> and all answers are sent in one request
+@bp.route('/start_quiz/<int:id>/single')
+@auth_required
+def start_quiz_single(id):
+    quiz = Quiz.query.get(id)
+    if not quiz:
+        flash('Quiz does not exist!')
+        return redirect(url_for('main.index'))
+    return render_template('user/start_quiz_single.html', quiz=quiz)
 
 
-@app.route('/submit_quiz/<int:id>', methods=['POST'])
+@bp.route('/submit_quiz/<int:id>', methods=['POST'])
 @auth_required
 def submit_quiz(id):
     quiz = Quiz.query.get(id)
     if not quiz:
         flash('Quiz does not exist!')
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     
-    score = 0 
+    # Cached question id -> correct option mapping, no Question rows are loaded
+    key = answer_key(quiz)
     #----score for last question---------
     selected_last_answer = request.form.get('ans')
-    length_of_questions = len(quiz.questions)
-    #if selected_last_answer and selected_last_answer == quiz.questions[length_of_questions-1].correct_option:
-        #score += 1
-    
-    questions = quiz.questions
-    answers = session.get('answers', {}) 
-    answers[str(quiz.questions[length_of_questions-1].id)]= selected_last_answer
 
-    for question in questions:
-        selected_answer = answers.get(str(question.id))  # Use str(question.id) to match the key format
-        if selected_answer and selected_answer == question.correct_option:
-            score += 1 
+    store = get_attempt_store()
+    attempt = current_attempt(store, quiz)
+    answers = store.answers(attempt['id']) if attempt else {}
+    if key.question_ids:
+        answers[str(key.question_ids[-1])]= selected_last_answer
 
-    score_record = Score(user_id=session['user_id'],
-                         quiz_id=quiz.id, score=score,
-                         date_attempted=datetime.now().date())
-    
-    db.session.add(score_record)
-    db.session.commit()
+    score = grade(key, answers)
+    record_score(session['user_id'], quiz.id, score)
 
-    session.pop('answers', None)
-    session.pop('remaining_time', None)
+    if attempt:
+        store.finish(attempt['id'])
+    session.pop('attempt_id', None)
 
-    flash(f'Quiz submitted successfully! Your score: {score}/{len(questions)}')
-    return redirect(url_for('score'))
+    flash(f'Quiz submitted successfully! Your score: {score}/{len(key.question_ids)}')
+    return redirect(url_for('main.score'))
 
-@app.route('/score')
+@bp.route('/score')
 @auth_required
 def score():
-    user = User.query.get(session['user_id'])
-    scores = Score.query.filter_by(user_id=user.id).all()
-    for score in scores:
-    # Count how many times the user has attempted this quiz before this score
-        attempt_number = Score.query.filter(
-            Score.user_id == user.id,
-            Score.quiz_id == score.quiz_id,
-            (Score.date_attempted < score.date_attempted) |  # Earlier dates
-            ((Score.date_attempted == score.date_attempted) & (Score.id <= score.id))  # Same date, earlier or same ID
-        ).count()
-        score.attempt_number = attempt_number 
-    return render_template('user/score.html', scores=scores)
-
-@app.route('/view_quiz_answers/<int:id>')
+    page = request.args.get('page', 1, type=int)
+    scores = queries.user_score_query(g.user_info.id).paginate(
+        page=page, per_page=current_app.config['SCORES_PER_PAGE'], error_out=False)
+    return stream_page('user/score.html', scores=scores)
+
+@bp.route('/view_quiz_answers/<int:id>')
 @auth_required
 def view_quiz_answers(id):
-    score = Score.query.get(id)
-    quiz = Quiz.query.get(score.quiz_id)
-    questions = quiz.questions
-    return render_template('user/quiz_ans.html', questions=questions)
-
-@app.route('/user/summary')
+    score = (db.session.query(Score.quiz_id, Quiz.version)
+             .join(Quiz, Quiz.id == Score.quiz_id).filter(Score.id == id).first())
+    if not score:
+        flash('Score does not exist!')
+        return redirect(url_for('main.score'))
+    key = ('quiz_answers', score.quiz_id, score.version)
+    questions = cached_fragment(key, lambda: render_template(
+        'user/quiz_answers.html',
+        questions=Question.query.filter(Question.quiz_id == score.quiz_id).order_by(Question.id).all()))
+    return conditional(key, lambda: render_template('user/quiz_ans.html', questions=questions))
+
+@bp.route('/user/summary')
 @auth_required
 def user_summary():
     user_id = session['user_id']
 
-    # Fetch subject-wise number of quizzes attempted by the user
-    subject_attempts = (
-        db.session.query(Subject.name, func.count(Score.id).label('attempt_count'))
-        .join(Chapter, Chapter.subject_id == Subject.id)
-        .join(Quiz, Quiz.chapter_id == Chapter.id)
-        .join(Score, Score.quiz_id == Quiz.id)
-        .filter(Score.user_id == user_id)
-        .group_by(Subject.name)
-        .all()
-    )
-
-    # Fetch month-wise number of quizzes attempted by the user
-    month_attempts = (
-        db.session.query(
-            func.strftime('%Y-%m', Score.date_attempted).label('month'),
-            func.count(Score.id).label('attempt_count')
-        )
-        .filter(Score.user_id == user_id)
-        .group_by(func.strftime('%Y-%m', Score.date_attempted))
-        .order_by('month')
-        .all()
-    )
+    # Subject-wise and month-wise number of quizzes attempted, read from the rollups
+    subject_attempts = summaries.user_subject_attempts(user_id)
+    month_attempts = summaries.user_month_attempts(user_id)
 
     return render_template(
         'user/summary.html',
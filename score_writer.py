@@ -0,0 +1,233 @@
+import atexit
+import json
+import os
+import queue
+import time
+from collections import Counter
+from datetime import date
+from glob import glob
+from threading import Lock, Thread
+from flask import current_app
+from sqlalchemy import insert
+from sqlalchemy.exc import DataError, IntegrityError
+from models import db, Score, Quiz, bump_counter
+from summaries import record_attempt
+
+# Optional write-behind for quiz submissions (SCORE_WRITE_BEHIND=true).
+#
+# submit_quiz hands the graded result to the ScoreWriter of its process: the row is
+# appended to a local spool file, then queued. A background thread saves the queue in
+# batches (one multi-row INSERT and one commit per batch). The spool file keeps queued
+# rows safe across a crash; spools of dead processes are replayed when a writer starts
+# or with "flask replay-score-spool". When the queue is full, rows are saved inline.
+#
+# Only a row the database refuses for good (e.g. its quiz was deleted) is dropped. On any
+# other error (e.g. "database is locked" in a burst) the rows stay queued and spooled,
+# and the writer retries them, waiting twice as long after each failure up to
+# SCORE_RETRY_MAX_DELAY seconds.
+
+PERMANENT_ERRORS = (IntegrityError, DataError)
+
+def spool_pid(path):
+    try:
+        return int(os.path.basename(path)[len('scores-'):-len('.jsonl')])
+    except ValueError:
+        return None
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def save_scores(rows):
+    db.session.execute(insert(Score), rows)
+    for quiz_id, count in Counter(row['quiz_id'] for row in rows).items():
+        bump_counter(Quiz.attempt_count, quiz_id, count)
+    for row in rows:
+        record_attempt(row['user_id'], row['quiz_id'], row['score'], row['date_attempted'])
+    db.session.commit()
+
+# A batch the database refuses is retried row by row, so one bad row can't block the
+# rest. Returns the rows not saved yet because of an error that may pass (always the
+# tail of `rows`), which the caller should try again later.
+def save_scores_safely(rows):
+    try:
+        save_scores(rows)
+        return []
+    except PERMANENT_ERRORS:
+        db.session.rollback()
+    except Exception:
+        db.session.rollback()
+        current_app.logger.warning('Could not save %s scores, will retry', len(rows), exc_info=True)
+        return rows
+    for index, row in enumerate(rows):
+        try:
+            save_scores([row])
+        except PERMANENT_ERRORS:
+            db.session.rollback()
+            current_app.logger.exception('Dropping score that could not be saved: %s', row)
+        except Exception:
+            db.session.rollback()
+            current_app.logger.warning('Could not save %s scores, will retry', len(rows) - index, exc_info=True)
+            return rows[index:]
+    return []
+
+# [(row, offset of the end of its line)]
+def read_spool(path, offset=0):
+    rows = []
+    with open(path, 'rb') as spool:
+        spool.seek(offset)
+        for line in spool:
+            offset += len(line)
+            if line.strip():
+                row = json.loads(line)
+                row['date_attempted'] = date.fromisoformat(row['date_attempted'])
+                rows.append((row, offset))
+    return rows
+
+def write_checkpoint(path, offset):
+    with open(path + '.offset.tmp', 'w') as checkpoint:
+        checkpoint.write(str(offset))
+    os.replace(path + '.offset.tmp', path + '.offset')
+
+def read_checkpoint(path):
+    try:
+        with open(path + '.offset', 'r') as checkpoint:
+            return int(checkpoint.read() or 0)
+    except FileNotFoundError:
+        return 0
+
+# Save the rows of spool files left behind by processes that are not running any more
+def replay_spools(spool_dir, batch_size=500):
+    replayed = 0
+    for path in sorted(glob(os.path.join(spool_dir, 'scores-*.jsonl'))):
+        pid = spool_pid(path)
+        if pid is None or (pid != os.getpid() and pid_alive(pid)):
+            continue
+        claimed = f'{path}.replay-{os.getpid()}'
+        try:
+            os.replace(path, claimed)
+        except FileNotFoundError:
+            continue  # another process claimed it first
+        offset = read_checkpoint(path)
+        items = read_spool(claimed, offset)
+        for start in range(0, len(items), batch_size):
+            batch = items[start:start + batch_size]
+            remaining = save_scores_safely([row for row, end in batch])
+            saved = len(batch) - len(remaining)
+            replayed += saved
+            if remaining:
+                # give the file back, the next replay carries on after the saved rows
+                done = start + saved
+                write_checkpoint(path, items[done - 1][1] if done else offset)
+                os.replace(claimed, path)
+                current_app.logger.warning('Left %s scores in %s for a later replay', len(items) - done, path)
+                return replayed
+        os.remove(claimed)
+        if os.path.exists(path + '.offset'):
+            os.remove(path + '.offset')
+    return replayed
+
+
+class ScoreWriter:
+    def __init__(self, app):
+        self.app = app
+        self.batch_size = app.config['SCORE_BATCH_SIZE']
+        self.interval = app.config['SCORE_FLUSH_INTERVAL']
+        self.fsync = app.config['SCORE_SPOOL_FSYNC']
+        self.retry_max_delay = app.config['SCORE_RETRY_MAX_DELAY']
+        self.spool_dir = app.config['SCORE_SPOOL_DIR'] or os.path.join(app.instance_path, 'score_spool')
+        self.queue = queue.Queue(maxsize=app.config['SCORE_QUEUE_SIZE'])
+        self.lock = Lock()
+        self.thread = None
+        self.stopping = False
+
+    def start(self):
+        os.makedirs(self.spool_dir, exist_ok=True)
+        replayed = replay_spools(self.spool_dir, self.batch_size)
+        if replayed:
+            current_app.logger.warning('Replayed %s scores from the spool of a stopped process', replayed)
+        self.spool_path = os.path.join(self.spool_dir, f'scores-{os.getpid()}.jsonl')
+        self.spool = open(self.spool_path, 'a', encoding='utf-8')
+        self.thread = Thread(target=self.run, name='score-writer', daemon=True)
+        self.thread.start()
+        atexit.register(self.stop)
+
+    # False when the queue is full, the caller then saves the score itself
+    def submit(self, user_id, quiz_id, score, date_attempted):
+        row = {'user_id': user_id, 'quiz_id': quiz_id, 'score': score, 'date_attempted': date_attempted}
+        with self.lock:  # spool and queue stay in the same order
+            if self.queue.full():
+                return False
+            self.spool.write(json.dumps(dict(row, date_attempted=date_attempted.isoformat())) + '\n')
+            self.spool.flush()
+            if self.fsync:
+                os.fsync(self.spool.fileno())
+            self.queue.put((row, self.spool.tell()))
+        return True
+
+    def next_batch(self):
+        try:
+            items = [self.queue.get(timeout=self.interval)]
+        except queue.Empty:
+            return []
+        while len(items) < self.batch_size:
+            try:
+                items.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return items
+
+    def run(self):
+        while not (self.stopping and self.queue.empty()):
+            items = self.next_batch()
+            if items:
+                self.flush(items)
+
+    def flush(self, items):
+        delay = self.interval
+        while True:
+            with self.app.app_context():
+                remaining = save_scores_safely([row for row, offset in items])
+            saved = len(items) - len(remaining)
+            if saved:
+                self.saved(items[saved - 1][1])
+            if not remaining:
+                return
+            items = items[saved:]
+            time.sleep(delay)
+            delay = min(delay * 2, self.retry_max_delay)
+
+    # the rows spooled up to `offset` are in the database
+    def saved(self, offset):
+        with self.lock:
+            if self.queue.empty() and offset == self.spool.tell():
+                # everything spooled is saved, start the spool over
+                self.spool.truncate(0)
+                self.spool.seek(0)
+                if os.path.exists(self.spool_path + '.offset'):
+                    os.remove(self.spool_path + '.offset')
+            else:
+                write_checkpoint(self.spool_path, offset)
+
+    def stop(self, timeout=10):
+        self.stopping = True
+        if self.thread and self.thread.is_alive():
+            self.thread.join(timeout)
+
+
+_start_lock = Lock()
+
+# started on the first submission, so each (forked) worker process gets its own thread and spool
+def get_score_writer():
+    with _start_lock:
+        writer = current_app.extensions.get('score_writer')
+        if writer is None:
+            writer = ScoreWriter(current_app._get_current_object())
+            writer.start()
+            current_app.extensions['score_writer'] = writer
+    return writer
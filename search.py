@@ -0,0 +1,168 @@
+import re
+from threading import Lock
+from sqlalchemy import event, text, bindparam, table, column, select, or_
+from sqlalchemy.engine import Connection
+from flask import current_app
+from models import db, User, Subject, Chapter, Quiz, Question
+import queries
+
+# Full text search for admin_search, backed by one SQLite FTS5 table.
+# Rows are kept in sync by mapper events, so every create/edit/delete
+# (routes, cascades, imports) updates the index in the same transaction.
+# On other databases, or with SEARCH_FTS=false, it falls back to ILIKE.
+
+search_index = table('search_index', column('kind'), column('entity_id'), column('rank'))
+
+# kind -> (model, title column, body column)
+INDEXED = {
+    'user': (User, 'name', 'username'),
+    'subject': (Subject, 'name', 'description'),
+    'chapter': (Chapter, 'name', 'description'),
+    'question': (Question, 'question_statement', 'question_title'),
+}
+
+# engines whose database is known to have the search_index table
+_checked_engines = set()
+_check_lock = Lock()
+
+def fts_enabled(bind=None):
+    bind = bind if bind is not None else db.engine
+    if not (current_app.config.get('SEARCH_FTS', True) and bind.dialect.name == 'sqlite'):
+        return False
+    ensure_search_index(bind)
+    return True
+
+def create_search_index(connection):
+    connection.execute(text(
+        'CREATE VIRTUAL TABLE IF NOT EXISTS search_index '
+        'USING fts5(kind UNINDEXED, entity_id UNINDEXED, title, body)'
+    ))
+
+# A database made by create_all() alone, or from before the index existed, has no
+# search_index table yet and every insert of an indexed row would fail: it is created
+# on first use (once per engine), existing rows need "flask rebuild-search-index".
+def ensure_search_index(bind):
+    engine = bind.engine
+    if engine in _checked_engines:
+        return
+    with _check_lock:
+        if engine in _checked_engines:
+            return
+        if isinstance(bind, Connection):
+            missing = add_search_index(bind)
+        else:
+            with bind.begin() as connection:
+                missing = add_search_index(connection)
+        _checked_engines.add(engine)
+    if missing:
+        current_app.logger.warning('Created the missing search index. If the database already had users, subjects, '
+                                   'chapters or questions, "flask rebuild-search-index" adds them to it.')
+
+# True if the table had to be created
+def add_search_index(connection):
+    exists = connection.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'search_index'")).first()
+    if not exists:
+        create_search_index(connection)
+    return not exists
+
+INSERT = text('INSERT INTO search_index (kind, entity_id, title, body) VALUES (:kind, :id, :title, :body)')
+
+def index_entity(connection, kind, entity):
+    model, title, body = INDEXED[kind]
+    remove_entity(connection, kind, entity.id)
+    connection.execute(INSERT, {'kind': kind, 'id': entity.id,
+                                'title': getattr(entity, title), 'body': getattr(entity, body) or ''})
+
+def remove_entity(connection, kind, entity_id):
+    connection.execute(text('DELETE FROM search_index WHERE kind = :kind AND entity_id = :id'),
+                       {'kind': kind, 'id': entity_id})
+
+# ids of rows deleted in bulk, one statement (one pass over the index) for all of them
+def remove_rows(connection, kind, ids):
+    if ids:
+        connection.execute(text('DELETE FROM search_index WHERE kind = :kind AND entity_id IN :ids')
+                           .bindparams(bindparam('ids', expanding=True)), {'kind': kind, 'ids': list(ids)})
+
+# rows of (id, title, body), for new rows inserted in bulk (bulk inserts skip the mapper events)
+def index_rows(connection, kind, rows):
+    if rows:
+        connection.execute(INSERT, [{'kind': kind, 'id': id, 'title': title, 'body': body or ''}
+                                    for id, title, body in rows])
+
+# Drop and refill the whole index, streaming each table in chunks
+def rebuild_search_index(chunk_size=1000):
+    with db.engine.begin() as connection:
+        connection.execute(text('DROP TABLE IF EXISTS search_index'))
+        create_search_index(connection)
+        for kind, (model, title, body) in INDEXED.items():
+            rows = connection.execution_options(yield_per=chunk_size).execute(
+                select(model.id, getattr(model, title), getattr(model, body)).order_by(model.id))
+            for chunk in rows.partitions():
+                index_rows(connection, kind, chunk)
+
+
+def _register(kind, model):
+    @event.listens_for(model, 'after_insert')
+    @event.listens_for(model, 'after_update')
+    def reindex(mapper, connection, target):
+        if fts_enabled(connection):
+            index_entity(connection, kind, target)
+
+    @event.listens_for(model, 'after_delete')
+    def unindex(mapper, connection, target):
+        if fts_enabled(connection):
+            remove_entity(connection, kind, target.id)
+
+for kind, (model, title, body) in INDEXED.items():
+    _register(kind, model)
+
+
+# every word of the query as a prefix term, all of them must match
+def match_expression(query):
+    return ' '.join(f'"{word}"*' for word in re.findall(r'\w+', query))
+
+# (ranked matches subquery or None, condition), condition None when there is nothing to search for
+def matching(kind, query, entity_id, ilike_columns):
+    if not fts_enabled():
+        if not query.strip():
+            return None, None
+        return None, or_(*[column.ilike(f'%{query}%') for column in ilike_columns])
+    match = match_expression(query)
+    if not match:
+        return None, None
+    matches = (
+        select(search_index.c.entity_id, search_index.c.rank)
+        .where(search_index.c.kind == kind, text('search_index MATCH :match').bindparams(match=match))
+        .subquery()
+    )
+    return matches, matches.c.entity_id == entity_id
+
+# Ranked (best match first) query for one admin_search parameter, ready to paginate
+def search_query(parameter, query):
+    if parameter == 'user':
+        base, entity_id, columns = db.session.query(User), User.id, [User.name, User.username]
+        kind = 'user'
+    elif parameter == 'sname':
+        base, entity_id, columns = queries.subject_query(), Subject.id, [Subject.name]
+        kind = 'subject'
+    elif parameter == 'chapter':
+        base, entity_id, columns = queries.chapter_query(), Chapter.id, [Chapter.name]
+        kind = 'chapter'
+    elif parameter == 'qname':  # quizzes of the matching chapters
+        base, entity_id, columns = queries.quiz_query(), Quiz.chapter_id, [Chapter.name]
+        kind = 'chapter'
+    elif parameter == 'question':
+        base = db.session.query(Question.id, Question.question_title, Question.quiz_id)
+        entity_id, columns = Question.id, [Question.question_statement]
+        kind = 'question'
+    else:
+        return None
+
+    matches, condition = matching(kind, query, entity_id, columns)
+    if condition is None:  # no search terms: everything, as ILIKE '%%' did
+        return base.order_by(None).order_by(Quiz.id if parameter == 'qname' else entity_id)
+    if matches is None:
+        return base.filter(condition)
+    return base.join(matches, condition).order_by(None).order_by(matches.c.rank, entity_id)
+
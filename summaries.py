@@ -0,0 +1,166 @@
+from sqlalchemy import case, insert, update, select, bindparam
+from sqlalchemy.dialects import sqlite, postgresql
+from sqlalchemy.sql import func
+from models import db, Subject, Chapter, Quiz, Score, SubjectStats, UserSubjectStats, UserMonthStats
+
+# The summary pages read these rollup tables instead of grouping the whole
+# Score table. record_attempt() runs inside the transaction that saves a Score,
+# forget_scores() inside the one that deletes scores in bulk (deletes.py) and
+# rebuild_subjects() inside the one that moves a quiz or chapter to another subject;
+# rebuild_summaries() recomputes everything ("flask rebuild-summaries").
+
+DIALECT_INSERT = {'sqlite': sqlite.insert, 'postgresql': postgresql.insert}
+
+# insert the row, or apply `updates` to the existing one
+def upsert(model, keys, values, updates):
+    dialect_insert = DIALECT_INSERT.get(db.session.get_bind().dialect.name)
+    if dialect_insert:
+        statement = dialect_insert(model).values(**keys, **values)
+        db.session.execute(statement.on_conflict_do_update(index_elements=list(keys), set_=updates))
+        return
+    updated = db.session.query(model).filter_by(**keys).update(updates, synchronize_session=False)
+    if not updated:
+        db.session.execute(insert(model).values(**keys, **values))
+
+def record_attempt(user_id, quiz_id, score, date_attempted):
+    subject_id = (
+        db.session.query(Chapter.subject_id)
+        .join(Quiz, Quiz.chapter_id == Chapter.id)
+        .filter(Quiz.id == quiz_id)
+        .scalar()
+    )
+    upsert(SubjectStats, {'subject_id': subject_id}, {'attempt_count': 1, 'top_score': score}, {
+        'attempt_count': SubjectStats.attempt_count + 1,
+        'top_score': case((SubjectStats.top_score < score, score), else_=SubjectStats.top_score),
+    })
+    upsert(UserSubjectStats, {'user_id': user_id, 'subject_id': subject_id}, {'attempt_count': 1},
+           {'attempt_count': UserSubjectStats.attempt_count + 1})
+    upsert(UserMonthStats, {'user_id': user_id, 'month': date_attempted.strftime('%Y-%m')}, {'attempt_count': 1},
+           {'attempt_count': UserMonthStats.attempt_count + 1})
+
+# subtracts `counts` ({key values: attempts}) from the rollup rows, dropping those left at zero
+def subtract_counts(model, key_columns, counts):
+    if not counts:
+        return
+    table = model.__table__
+    keys = [table.c[name] for name in key_columns]
+    match = [key == bindparam(f'k_{key.name}') for key in keys]
+    db.session.execute(
+        update(table).where(*match).values(attempt_count=table.c.attempt_count - bindparam('n')),
+        [{**{f'k_{name}': value for name, value in zip(key_columns, key)}, 'n': n} for key, n in counts.items()])
+    db.session.execute(table.delete().where(*match, table.c.attempt_count <= 0),
+                       [{f'k_{name}': value for name, value in zip(key_columns, key)} for key in counts])
+
+# Takes scores that are about to be deleted out of the attempt counts. The top scores
+# of their subjects are left as they are, see refresh_top_scores().
+def forget_scores(score_ids):
+    rows = (
+        db.session.query(Score.user_id, Chapter.subject_id, Score.date_attempted)
+        .join(Quiz, Quiz.id == Score.quiz_id)
+        .join(Chapter, Chapter.id == Quiz.chapter_id)
+        .filter(Score.id.in_(score_ids))
+        .all()
+    )
+    subjects, user_subjects, user_months = {}, {}, {}
+    for user_id, subject_id, date_attempted in rows:
+        month = date_attempted.strftime('%Y-%m')
+        subjects[(subject_id,)] = subjects.get((subject_id,), 0) + 1
+        user_subjects[(user_id, subject_id)] = user_subjects.get((user_id, subject_id), 0) + 1
+        user_months[(user_id, month)] = user_months.get((user_id, month), 0) + 1
+    subtract_counts(SubjectStats, ('subject_id',), subjects)
+    subtract_counts(UserSubjectStats, ('user_id', 'subject_id'), user_subjects)
+    subtract_counts(UserMonthStats, ('user_id', 'month'), user_months)
+
+# recomputes the top score of a few subjects from their remaining scores
+def refresh_top_scores(subject_ids):
+    top_score = (
+        select(func.coalesce(func.max(Score.score), 0))
+        .join(Quiz, Quiz.id == Score.quiz_id)
+        .join(Chapter, Chapter.id == Quiz.chapter_id)
+        .where(Chapter.subject_id == SubjectStats.subject_id)
+        .scalar_subquery()
+    )
+    db.session.query(SubjectStats).filter(SubjectStats.subject_id.in_(subject_ids)).update(
+        {SubjectStats.top_score: top_score}, synchronize_session=False)
+
+# the per subject rollups, of all subjects or of `subject_ids` only
+def insert_subject_rollups(subject_ids=None):
+    subjects = db.session.query(Chapter.subject_id, func.count(Score.id), func.max(Score.score))
+    user_subjects = db.session.query(Score.user_id, Chapter.subject_id, func.count(Score.id))
+    if subject_ids is not None:
+        subjects = subjects.filter(Chapter.subject_id.in_(subject_ids))
+        user_subjects = user_subjects.filter(Chapter.subject_id.in_(subject_ids))
+    db.session.execute(insert(SubjectStats).from_select(
+        ['subject_id', 'attempt_count', 'top_score'],
+        subjects
+        .join(Quiz, Quiz.chapter_id == Chapter.id)
+        .join(Score, Score.quiz_id == Quiz.id)
+        .group_by(Chapter.subject_id)
+    ))
+    db.session.execute(insert(UserSubjectStats).from_select(
+        ['user_id', 'subject_id', 'attempt_count'],
+        user_subjects
+        .join(Quiz, Quiz.id == Score.quiz_id)
+        .join(Chapter, Chapter.id == Quiz.chapter_id)
+        .group_by(Score.user_id, Chapter.subject_id)
+    ))
+
+# After a quiz or chapter moved to another subject: recounts both subjects from their
+# scores (the per month counts don't depend on the subject). Call it once the move is flushed.
+def rebuild_subjects(subject_ids):
+    for model in (SubjectStats, UserSubjectStats):
+        db.session.query(model).filter(model.subject_id.in_(subject_ids)).delete(synchronize_session=False)
+    insert_subject_rollups(subject_ids)
+
+# 'YYYY-MM' of a date column, in SQL, as date.strftime('%Y-%m') gives it in Python
+def month_key(column):
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        return func.to_char(column, 'YYYY-MM')
+    if dialect in ('mysql', 'mariadb'):
+        return func.date_format(column, '%Y-%m')
+    return func.strftime('%Y-%m', column)
+
+def rebuild_summaries():
+    for model in (SubjectStats, UserSubjectStats, UserMonthStats):
+        db.session.query(model).delete()
+    insert_subject_rollups()
+    month = month_key(Score.date_attempted)
+    db.session.execute(insert(UserMonthStats).from_select(
+        ['user_id', 'month', 'attempt_count'],
+        db.session.query(Score.user_id, month, func.count(Score.id))
+        .group_by(Score.user_id, month)
+    ))
+
+def subject_attempts():
+    return (
+        db.session.query(Subject.name, SubjectStats.attempt_count)
+        .join(SubjectStats, SubjectStats.subject_id == Subject.id)
+        .order_by(Subject.name)
+        .all()
+    )
+
+def subject_top_scores():
+    return (
+        db.session.query(Subject.name, SubjectStats.top_score)
+        .join(SubjectStats, SubjectStats.subject_id == Subject.id)
+        .order_by(Subject.name)
+        .all()
+    )
+
+def user_subject_attempts(user_id):
+    return (
+        db.session.query(Subject.name, UserSubjectStats.attempt_count)
+        .join(UserSubjectStats, UserSubjectStats.subject_id == Subject.id)
+        .filter(UserSubjectStats.user_id == user_id)
+        .order_by(Subject.name)
+        .all()
+    )
+
+def user_month_attempts(user_id):
+    return (
+        db.session.query(UserMonthStats.month, UserMonthStats.attempt_count)
+        .filter(UserMonthStats.user_id == user_id)
+        .order_by(UserMonthStats.month)
+        .all()
+    )
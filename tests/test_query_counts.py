@@ -0,0 +1,96 @@
+"""The list pages run a fixed number of SQL statements however many quizzes there are.
+
+Run from the project folder: python -m pytest tests
+"""
+import os
+import sys
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import event
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app import create_app
+from config import Config
+from models import db, User, Subject, Chapter, Quiz, Question, Score
+
+
+class QueryCountConfig(Config):
+    TESTING = True
+    SECRET_KEY = 'test'
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    CACHE_BACKEND = 'none'  # every request queries, as on a cache miss
+    JINJA_BYTECODE_CACHE = False
+    METRICS = False
+    INDEX_AUDIT = False
+    SCORE_WRITE_BEHIND = False
+
+
+def make_app(quizzes):
+    app = create_app(QueryCountConfig)
+    with app.app_context():
+        db.create_all()
+        admin = User(username='admin', passhash='-', name='Admin', is_admin=True)
+        user = User(username='user', passhash='-', name='User')
+        db.session.add_all([admin, user])
+        db.session.flush()
+        for n in range(quizzes):
+            subject = Subject(name=f'Subject {n}', description='d', chapter_count=1)
+            db.session.add(subject)
+            db.session.flush()
+            chapter = Chapter(name=f'Chapter {n}', description='d', subject_id=subject.id)
+            db.session.add(chapter)
+            db.session.flush()
+            quiz = Quiz(date_of_quiz=date.today() + timedelta(days=1), time_duration=timedelta(minutes=10),
+                        remarks='r', chapter_id=chapter.id, question_count=2, attempt_count=1)
+            db.session.add(quiz)
+            db.session.flush()
+            for k in range(2):
+                db.session.add(Question(quiz_id=quiz.id, question_title=f't{k}', question_statement=f'q{k}',
+                                        option1='a', option2='b', option3='c', option4='d', correct_option='a'))
+            db.session.add(Score(user_id=user.id, quiz_id=quiz.id, score=1, date_attempted=date.today()))
+        db.session.commit()
+        ids = {'admin': admin.id, 'user': user.id}
+    return app, ids
+
+def client_for(app, user_id, is_admin):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = user_id
+        session['is_admin'] = is_admin
+    return client
+
+def statements(app, client, path):
+    client.get(path).get_data()  # warm up (lazy imports, per process caches)
+    count = []
+    with app.app_context():
+        engine = db.engine
+    listener = lambda *args: count.append(1)
+    event.listen(engine, 'before_cursor_execute', listener)
+    try:
+        response = client.get(path)
+        response.get_data()
+    finally:
+        event.remove(engine, 'before_cursor_execute', listener)
+    assert response.status_code == 200, (path, response.status_code)
+    return len(count)
+
+def page_statements(quizzes):
+    app, ids = make_app(quizzes)
+    admin = client_for(app, ids['admin'], True)
+    user = client_for(app, ids['user'], False)
+    return {
+        'index': statements(app, user, '/'),
+        'score': statements(app, user, '/score'),
+        'quiz': statements(app, admin, '/quiz'),
+        'admin': statements(app, admin, '/admin'),
+        # every chapter matches, so every quiz goes through the search join
+        'admin_search': statements(app, admin, '/admin/search?parameter=qname&query=Chapter'),
+    }
+
+
+@pytest.mark.parametrize('page', ['index', 'score', 'quiz', 'admin', 'admin_search'])
+def test_statements_do_not_grow_with_quizzes(page):
+    assert page_statements(10)[page] == page_statements(1)[page]
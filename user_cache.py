@@ -0,0 +1,49 @@
+from collections import OrderedDict, namedtuple
+from threading import Lock
+from time import monotonic
+from flask import g, session, current_app
+from sqlalchemy import event
+from models import db, User
+
+# What auth_required/admin_required need to know about the logged in user,
+# cached per process for USER_CACHE_TTL seconds so most requests skip the lookup.
+# At most USER_CACHE_SIZE users are kept, the least recently used go first.
+UserInfo = namedtuple('UserInfo', ['id', 'is_admin', 'name'])
+
+_cache = OrderedDict()
+_lock = Lock()
+
+def get_user_info(user_id):
+    now = monotonic()
+    with _lock:
+        entry = _cache.get(user_id)
+        if entry and entry[1] > now:
+            _cache.move_to_end(user_id)
+            return entry[0]
+        if entry:  # expired
+            del _cache[user_id]
+    row = db.session.query(User.id, User.is_admin, User.name).filter(User.id == user_id).first()
+    if row is None:
+        invalidate_user(user_id)
+        return None
+    info = UserInfo(*row)
+    with _lock:
+        _cache[user_id] = (info, now + current_app.config.get('USER_CACHE_TTL', 30))
+        _cache.move_to_end(user_id)
+        while len(_cache) > current_app.config.get('USER_CACHE_SIZE', 10000):
+            _cache.popitem(last=False)
+    return info
+
+def invalidate_user(user_id):
+    with _lock:
+        _cache.pop(user_id, None)
+
+# Full User row, loaded at most once per request
+def current_user():
+    if 'user' not in g:
+        g.user = db.session.get(User, session['user_id'])
+    return g.user
+
+@event.listens_for(User, 'after_delete')
+def user_deleted(mapper, connection, target):
+    invalidate_user(target.id)
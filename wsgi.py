@@ -0,0 +1,10 @@
+from app import create_app
+from rendering import warm_templates
+
+# Entry point for a production WSGI server: "gunicorn wsgi:app" (settings in gunicorn.conf.py)
+app = create_app()
+# .env turns debug on for "flask run", it never belongs behind gunicorn
+# (it also re-reads every template from disk on each render)
+app.debug = False
+# compiled once here, the forked workers share them
+warm_templates(app)